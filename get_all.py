@@ -1,42 +1,213 @@
-import subprocess
+import io
 import sys
 import os
+import time
+import queue
+import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import get_options
 
-def get_options(symbol, option=None, outdir=None, refresh_option=None):
-    args = ["python", "get_options.py"] 
+# output folder of each scan mode
+MODE_DIRS = {"IC": "ic", "put": "puts", "call": "calls"}
 
-    if refresh_option:
-        args.append(refresh_option) 
+# loaded chains waiting for a scan worker, bounds the memory they take
+PIPELINE_DEPTH = 4
+# loader threads, each waits on one fetch at a time
+LOAD_THREADS = get_options.FETCH_CONCURRENCY
 
-    if option:
-        args.append(option)
-    args.append(symbol)
+def load_symbol(symbol, refresh_option=None):
+    """
+    load the chain of symbol for scan_loaded()
+    returns (contracts, messages), contracts is None when the chain could not be loaded
+    """
+    try:
+        return get_options.load_scan(symbol, reload=refresh_option == "--reload")
+    except SystemExit:
+        # get_options gives up on bad data with sys.exit
+        return (None, "")
 
-    if outdir and not os.path.isdir(outdir):
-        os.mkdir(outdir)
-    
-    fout = open("tmp.txt", "w")
-    result = subprocess.run(args, stdout=fout)
-    fout.close()
-    if result.returncode != 0:
-        print(f"got rc: {result.returncode} for symbol: {symbol}")
-    elif outdir: 
-        os.rename("tmp.txt", f"{outdir}/{symbol}.txt")
-    return result.returncode
+def scan_loaded(symbol, contracts, preamble, folder=None):
+    """
+    run the IC, put and call scans of symbol on the loaded chain,
+    the text of each goes to {folder}/{ic,puts,calls}/{symbol}.txt
+    returns the result records of the scans, None when the scans gave up
+    """
+    modes = get_options.SCAN_MODES
+    outputs = {mode: io.StringIO() for mode in modes}
+    try:
+        records = get_options.run_scan(symbol, contracts, preamble, modes, outputs)
+    except SystemExit:
+        return None
+    if folder:
+        for mode in modes:
+            with open(f"{folder}/{MODE_DIRS[mode]}/{symbol}.txt", "w") as f:
+                f.write(outputs[mode].getvalue())
+    return records
+
+def timed_scan(symbol, contracts, preamble, folder=None):
+    # scan_loaded() and the seconds it took, run by the scan workers
+    start = time.perf_counter()
+    records = scan_loaded(symbol, contracts, preamble, folder)
+    return (records, time.perf_counter() - start)
+
+def new_pipeline_stats(depth, jobs):
+    stats = {}
+    stats["load"] = {"count": 0, "busy": 0.0, "workers": LOAD_THREADS}
+    stats["queue"] = {"size": depth, "max": 0, "total": 0, "samples": 0}
+    stats["scan"] = {"count": 0, "busy": 0.0, "workers": jobs, "idle": 0.0}
+    stats["wall"] = 0.0
+    return stats
+
+def print_pipeline_stats(stats):
+    wall = max(stats["wall"], 1e-9)
+    print(f"pipeline: {stats['load']['count']} symbols in {stats['wall']:.2f}s")
+    for stage in ("load", "scan"):
+        s = stats[stage]
+        print(f"  {stage}: {s['count']} in {s['busy']:.2f}s busy over {s['workers']} workers, {s['count'] / wall:.1f}/s")
+    q = stats["queue"]
+    mean = q["total"] / max(q["samples"], 1)
+    print(f"  queue: depth max {q['max']} of {q['size']}, mean {mean:.1f}, scan idle {stats['scan']['idle']:.2f}s waiting for chains")
+
+def scan_symbols(symbols, folder=None, refresh_option=None, jobs=1, depth=PIPELINE_DEPTH, stats=None):
+    """
+    load_symbol() and scan_loaded() of each symbol as a pipeline: LOAD_THREADS loader threads fetch
+    the chains into a queue of at most depth entries while the scan workers take
+    them out, so the network waits overlap the candidate search; the loaders block
+    while the queue is full. with jobs > 1 the scans run in a pool of processes
+    yields (symbol, records) in the order of symbols
+      stats: dict filled with the per stage counters, see new_pipeline_stats()
+    """
+    if stats is None:
+        stats = {}
+    stats.update(new_pipeline_stats(depth, jobs))
+    start = time.perf_counter()
+
+    pool = None
+    if jobs > 1:
+        # fork before any thread is started, the workers must not run the main code of this script again
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+    loaded = queue.Queue(depth)
+    scanned = queue.Queue()
+    stop = threading.Event()
+
+    def load(index, symbol):
+        if stop.is_set():
+            return
+        load_start = time.perf_counter()
+        item = (None, "")
+        try:
+            item = load_symbol(symbol, refresh_option)
+        except Exception:
+            logging.exception(f"{symbol}: load failed")
+        entry = (index, symbol, item, time.perf_counter() - load_start)
+        while not stop.is_set():
+            try:
+                loaded.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def take():
+        # next loaded chain, counts the queue depth the scan side finds
+        q = stats["queue"]
+        q["max"] = max(q["max"], loaded.qsize())
+        q["total"] += loaded.qsize()
+        q["samples"] += 1
+        wait_start = time.perf_counter()
+        entry = loaded.get()
+        stats["scan"]["idle"] += time.perf_counter() - wait_start
+        return entry
+
+    def finish(index, symbol, result):
+        # pool callback
+        (records, seconds) = result
+        stats["scan"]["count"] += 1
+        stats["scan"]["busy"] += seconds
+        scanned.put((index, symbol, records))
+
+    def failed(index, symbol, error):
+        logging.error(f"{symbol}: scan failed: {error}")
+        scanned.put((index, symbol, None))
+
+    # the loader threads print into their own buffers
+    stdout = sys.stdout
+    sys.stdout = get_options.ThreadOutput(stdout)
+    loaders = ThreadPoolExecutor(LOAD_THREADS)
+    try:
+        for (index, symbol) in enumerate(symbols):
+            loaders.submit(load, index, symbol)
+
+        results = {}
+        next_index = 0
+        running = 0
+        for taken in range(len(symbols) + 1):
+            # collect the finished pool scans, at most jobs are handed out at once,
+            # the rest wait in the bounded queue
+            while running and (running >= jobs or not scanned.empty() or taken == len(symbols)):
+                (index, symbol, records) = scanned.get()
+                results[index] = (symbol, records)
+                running -= 1
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+            if taken == len(symbols):
+                break
+
+            (index, symbol, (contracts, preamble), seconds) = take()
+            stats["load"]["count"] += 1
+            stats["load"]["busy"] += seconds
+            if contracts is None:
+                stdout.write(preamble)
+                results[index] = (symbol, None)
+            elif pool is None:
+                (records, seconds) = timed_scan(symbol, contracts, preamble, folder)
+                stats["scan"]["count"] += 1
+                stats["scan"]["busy"] += seconds
+                results[index] = (symbol, records)
+            else:
+                pool.apply_async(timed_scan, (symbol, contracts, preamble, folder),
+                    callback=functools.partial(finish, index, symbol),
+                    error_callback=functools.partial(failed, index, symbol))
+                running += 1
+            del contracts
+    finally:
+        stop.set()
+        loaders.shutdown(wait=True, cancel_futures=True)
+        sys.stdout = stdout
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        stats["wall"] = time.perf_counter() - start
 
 #
 # main
 #
 if len(sys.argv) <= 2 or sys.argv[1] in ('-h', '--help'):
-    print("usage: python get_all.py [--reload|--useold|--dataonly] [stocklist_file] [out_dir]")
+    print("usage: python get_all.py [--jobs N] [--reload|--useold|--dataonly] [stocklist_file] [out_dir]")
     sys.exit(0)
 
 argnum = 1
 
+jobs = 1
 refresh_option = None   # or "--reload" or "--useold" or "--dataonly"
-if sys.argv[argnum] in ("--reload", "--useold", "--dataonly"):
-    refresh_option = sys.argv[argnum]
-    argnum += 1
+while argnum < len(sys.argv) and sys.argv[argnum].startswith("--"):
+    if sys.argv[argnum] in ("--reload", "--useold", "--dataonly"):
+        refresh_option = sys.argv[argnum]
+        argnum += 1
+    elif sys.argv[argnum] == "--jobs" and argnum + 1 < len(sys.argv) and sys.argv[argnum + 1].isdigit() and int(sys.argv[argnum + 1]) > 0:
+        jobs = int(sys.argv[argnum + 1])
+        argnum += 2
+    else:
+        print(f"unexpected option: {sys.argv[argnum]}")
+        sys.exit(1)
+if argnum >= len(sys.argv):
+    print("stocklist_file missing")
+    sys.exit(1)
+
+get_options.setup_logging()
 
 stocklist_file = sys.argv[argnum]
 argnum += 1
@@ -51,6 +222,16 @@ if len(sys.argv) > argnum:
 
     if not os.path.isdir(folder):
         os.mkdir(folder)
+    for subdir in MODE_DIRS.values():
+        if not os.path.isdir(f"{folder}/{subdir}"):
+            os.mkdir(f"{folder}/{subdir}")
+
+# result record of every run, read by make_summary.py
+record = None
+if folder:
+    record = f"{folder}/results.jsonl"
+    if os.path.isfile(record):
+        os.remove(record)
 
 symbols = []
 with open(stocklist_file, "r") as f:
@@ -65,29 +246,27 @@ with open(stocklist_file, "r") as f:
             print(f"ignoring symbol: {symbol}")
             line = f.readline()
             continue
-        print(symbol)
-        
-        # do ic (or just update data files in case of reload=--dataonly)
-        outdir = None
-        if folder:
-            outdir = folder + "/ic"
-        rc = get_options(symbol, outdir=outdir, refresh_option=refresh_option)
-        if rc == 0:
-            symbols.append(symbol)    
-        
-        if refresh_option != "--dataonly":
-            # do puts
-            if folder:
-                outdir = folder + "/puts"
-            rc = get_options(symbol, option="--puts", outdir=outdir, refresh_option=refresh_option) 
-            #print(f"{cnt}: {len(fields)}")
-        
-            # do calls
-            if folder:
-                outdir = folder + "/calls"
-            rc = get_options(symbol, option="--calls", outdir=outdir, refresh_option=refresh_option)
-        
+        symbols.append(symbol)
         line = f.readline()
-        
 
-print(f"got data for {len(symbols)} symbols")
+if refresh_option == "--dataonly":
+    # just update the data files, fetched concurrently
+    count = len(get_options.refresh_chains(symbols))
+    print(f"got data for {count} symbols")
+    sys.exit(0)
+
+# do ic, puts and calls
+count = 0
+stats = {}
+for (symbol, records) in scan_symbols(symbols, folder=folder, refresh_option=refresh_option, jobs=jobs, stats=stats):
+    if records is None:
+        print(f"could not get options for symbol: {symbol}")
+        continue
+    print(symbol)
+    count += 1
+    if record:
+        for mode in records:
+            get_options.save_record(record, records[mode])
+
+print(f"got data for {count} symbols")
+print_pipeline_stats(stats)
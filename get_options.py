@@ -1,9 +1,25 @@
 import sys
 import os
 import time
+import json
+import re
+import io
+import contextlib
+import struct
+import hashlib
+import gzip
+import lzma
 import logging
-from datetime import datetime
+import heapq
+import bisect
+import collections
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from datetime import datetime, timedelta
 import requests
+import numpy as np
 
 ARGS = {}
 
@@ -22,18 +38,86 @@ MIN_TC = 0
 MIN_TCW = 33.4
 MIN_TCU = 0
 
+# the IC join pairs every call spread with every put spread, with IC_SYMMETRY
+# (or --symmetry) only the ICs within the symmetry limits below
+IC_SYMMETRY = False
 SELL_SYMMETRY = 1 #0.12
 TOTAL_SYMMETRY = 1 #0.25
 WIDTH_SYMMETRY = 10 #10, no use
+# slack on the SELL_SYMMETRY window of the IC join, the exact check follows
+SYMMETRY_SLACK = 1e-9
+
+# slack added to the --top upper bounds to absorb float rounding
+# differences between the spread props and the IC props
+TOP_BOUND_SLACK = 1e-6
+
+# call spreads per shard of the parallel IC evaluation (--workers),
+# fixed so the shards and the merged result do not depend on the worker count
+IC_SHARD_CALLS = 16
 
 # SORT_KEYS = ("et", "ml", "width", "tc_w","tc", "symm", "tc_u", "tcc", "tcc_w")
 
 NON_REVERSE_SORT = {"width", "ml", "symm"}
+
+# prop the --record result picks the best candidate by, for each kind of run
+RECORD_BEST_KEYS = {"IC": "et", "call": "etc", "put": "etp"}
+# props the metrics stage sets on the candidates of each kind, the possible sort keys
+KIND_PROPS = {
+    "IC": ("tc", "width", "et", "tc_w", "tc_u", "beven"),
+    "put": ("tcp", "width", "tcp_w", "tcp_u", "etp", "bevenp"),
+    "call": ("tcc", "width", "tcc_w", "tcc_u", "etc", "bevenc"),
+}
+# modes of scan(), named by the kind of candidates they search
+SCAN_MODES = ("IC", "put", "call")
 PRINT_PROPS = ["et", "etp", "etc", "tc", "tcp", "tcc", "tc_w", "tcp_w", "tcc_w", "tc_u", "tcp_u", "tcc_u", "beven", "bevenp", "bevenc"]
 OPTION_PROPS = ["description", "symbol", "putCall", "strikePrice", "bid", "ask", "last", "mark", "bidAskSize",
     "highPrice", "lowPrice", "openPrice", "closePrice", "totalVolume", 
     "netChange", "volatility", "delta", "gamma", "theta", "vega", "openInterest", "timeValue",
     "theoreticalOptionValue", "daysToExpiration"]
+# binary snapshot: magic, header length, json header, then one 8 byte aligned block per column
+SNAPSHOT_MAGIC = b"OPTSNAP1"
+# tokens for skipping over json values of a chain response without decoding them
+JSON_SPACE = re.compile(r"[ \t\n\r]*")
+# a run of scalars and strings up to the next bracket
+JSON_FLAT = re.compile(r'[^\[\]{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^\[\]{}"]*)*')
+JSON_DECODER = json.JSONDecoder()
+# chain api and the fetch limits: concurrent requests, requests per second,
+# retries of a 429 or 5xx answer with a delay doubling from FETCH_BACKOFF seconds
+CHAINS_URL = "https://api.tdameritrade.com/v1/marketdata/chains"
+FETCH_CONCURRENCY = 8
+FETCH_RATE = 2.0
+FETCH_RETRIES = 5
+FETCH_BACKOFF = 1.0
+FETCH_TIMEOUT = 30
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# raw chain responses: gzipped once per sha256 under RAW_STORE_DIR/objects,
+# every request listed in RAW_STORE_DIR/{symbol}.jsonl
+RAW_STORE_DIR = "data/raw"
+# compressed snapshot archive (--archive): magic, codec name, then a compressed stream of
+# a json header and the encoded columns
+ARCHIVE_MAGIC = b"OPTSNAPZ"
+ARCHIVE_CODEC = "lzma"  # or "gzip"
+# float columns are stored as integer multiples of 1/ARCHIVE_SCALE when that is exact
+ARCHIVE_SCALE = 1000
+# per symbol list of the snapshots in data/{symbol}, sorted by date
+MANIFEST_FILENAME = "manifest.json"
+# compacted history (--compact): one data/{symbol}/{symbol}-history-{YYYY-MM}.hist partition per month,
+# listed with their zone maps in data/{symbol}/HISTORY_FILENAME
+HISTORY_FILENAME = "history.json"
+# columns with a min/max zone map per put/call section of a partition
+ZONE_PROPS = ("delta", "strikePrice")
+# columns a history partition can have
+HISTORY_COLUMNS = ["date", "underlying"] + OPTION_PROPS
+# intraday snapshot log: data/{symbol}/{symbol}.log holds every fetched snapshot back to back,
+# data/{symbol}/{symbol}.idx one fixed size record per snapshot
+LOG_INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<i8"), ("length", "<i8")])
+# column types for OPTION_PROPS, anything not listed is stored as float
+STRING_PROPS = {"description", "symbol", "putCall", "bidAskSize"}
+# strike and price columns, held as int32 counts of 1/PRICE_SCALE dollars
+# (tenths of a cent) with --fixed-point, the metrics convert them back to float
+PRICE_PROPS = {"strikePrice", "bid", "ask", "last", "mark", "highPrice", "lowPrice", "openPrice", "closePrice"}
+PRICE_SCALE = 1000
+INT_PROPS = {"totalVolume", "openInterest", "daysToExpiration"}
 loglevel = logging.ERROR # DEBUG or INFO or ERROR
 
 def get_dateString(day_delta=0, from_date=None):
@@ -105,271 +189,229 @@ def descIsPM(desc):
         return False
  
 
-class Option:     
-        
-    def __init__(self, propmap):
-        self._propmap = propmap
+def prop_dtype(propname):
+    if propname in STRING_PROPS:
+        return str
+    elif propname in INT_PROPS:
+        return np.int64
+    else:
+        return float
+
+
+def price_column(values, scale, fixed_point):
+    """
+    a PRICE_PROPS column as float dollars, or as int32 counts of 1/PRICE_SCALE with fixed_point
+    scale is set when values are already scaled integers, like the columns of a fixed point snapshot
+    """
+    if scale:
+        values = np.asarray(values)
+        if fixed_point and scale == PRICE_SCALE:
+            return values.astype(np.int32, copy=False)
+        values = values / scale
+    else:
+        values = np.asarray(values, dtype=float)
+    if not fixed_point:
+        return values
+    scaled = np.rint(values * PRICE_SCALE)
+    if not np.isfinite(scaled).all() or np.abs(scaled).max(initial=0) > np.iinfo(np.int32).max:
+        raise ValueError("price column does not fit the fixed point format")
+    return scaled.astype(np.int32)
+
+
+class OptionChain:
+    """
+    columnar storage for the puts or calls of one expiration,
+    one array per OPTION_PROPS column indexed by option number
+    scales maps the columns that hold scaled integers to their scale
+    """
+
+    def __init__(self, columns=None, scales=None):
+        self._columns = {}
+        self._count = 0
+        # PRICE_PROPS columns stored as fixed point
+        self._scaled = set()
+        # delta and strike indexes, built on first use
+        self._delta_order = None
+        self._delta_sorted = None
+        self._delta_nan = None
+        self._strike_rank = None
+        if not columns:
+            return
+        if scales is None:
+            scales = {}
+        fixed_point = ARGS.get("fixed_point", False)
+        for propname in OPTION_PROPS:
+            if propname not in columns:
+                continue
+            if propname in PRICE_PROPS:
+                self._columns[propname] = price_column(columns[propname], scales.get(propname), fixed_point)
+                if fixed_point:
+                    self._scaled.add(propname)
+            else:
+                self._columns[propname] = np.asarray(columns[propname], dtype=prop_dtype(propname))
+            self._count = len(self._columns[propname])
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return Option(self, index)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield Option(self, index)
+
+    @property
+    def desc(self):
+        return self._columns["description"]
+
+    @property
+    def delta(self):
+        return self._columns["delta"]
+
+    @property
+    def price(self):
+        return self.column("mark")
+
+    @property
+    def strike(self):
+        return self.column("strikePrice")
+
+    @property
+    def scales(self):
+        return {propname: PRICE_SCALE for propname in self._scaled}
+
+    def has_column(self, propname):
+        return propname in self._columns
+
+    def column(self, propname):
+        # prices in dollars, fixed point columns are converted
+        return self.values(propname, slice(None))
+
+    def values(self, propname, index):
+        column = self._columns[propname]
+        if propname in self._scaled:
+            return column[index] / PRICE_SCALE
+        return column[index]
+
+    def stored_column(self, propname):
+        # the column as stored, strikes and prices compare exactly as fixed point
+        return self._columns[propname]
+
+    def get_propnames(self):
+        return list(self._columns.keys())
+
+    def _build_index(self):
+        if self._delta_order is not None:
+            return
+        delta = self.delta
+        order = np.argsort(delta, kind="stable")
+        self._delta_order = order
+        self._delta_sorted = delta[order]
+        # nan deltas sort last, the range check never rejected them
+        valid = np.count_nonzero(~np.isnan(self._delta_sorted))
+        self._delta_nan = order[valid:]
+        self._strike_rank = np.empty(self._count, dtype=np.int64)
+        self._strike_rank[np.argsort(self.stored_column("strikePrice"), kind="stable")] = np.arange(self._count)
+
+    def delta_band(self, delta_range):
+        """
+        indexes of the options with delta within delta_range (inclusive), in chain order
+        a bisect on the delta index instead of a test of every option
+        """
+        self._build_index()
+        lo = np.searchsorted(self._delta_sorted, delta_range[0], side="left")
+        hi = np.searchsorted(self._delta_sorted, delta_range[1], side="right")
+        return np.sort(np.concatenate([self._delta_order[lo:hi], self._delta_nan]))
+
+    def strike_argsort(self, index):
+        # permutation that orders the options in index by strike
+        self._build_index()
+        return np.argsort(self._strike_rank[index], kind="stable")
+
+
+class Option:
+    """
+    view of a single option in an OptionChain
+    """
+    __slots__ = ("_chain", "_index")
+
+    def __init__(self, chain, index):
+        self._chain = chain
+        self._index = index
 
     def __str__(self):
         s = f"{self.desc} -- delta: {self.delta:.2f} price: {self.price:.2f} strike: {self.strike}"
         return s
 
+    @property
+    def index(self):
+        return self._index
+
     @property
     def desc(self):
-        return self._propmap["description"]
+        return str(self._chain.desc[self._index])
 
     @property
     def delta(self):
-        return self._propmap["delta"]
+        return float(self._chain.delta[self._index])
 
     @property
     def price(self):
-        return self._propmap["mark"]
+        return float(self._chain.values("mark", self._index))
  
     @property
     def strike(self):
-        return self._propmap["strikePrice"]
+        return float(self._chain.values("strikePrice", self._index))
 
     def isProp(self, propname):
-        if propname in OPTION_PROPS and propname in self._propmap:
+        if propname in OPTION_PROPS and self._chain.has_column(propname):
             return True
         else:
             return False
     def getProp(self, propname):
-        return self._propmap[propname]
+        return self._chain.values(propname, self._index).item()
 
     def getPropNames(self):
-        propnames = []
-        for propname in OPTION_PROPS:
-            if propname in self._propmap:
-                propnames.append(propname)
-        return propnames
+        return self._chain.get_propnames()
 
 
 class Candidate:
-    def __init__(self, cs=None, cb=None, ps=None, pb=None, underlying=None, volatility=None, interestRate=None, expireDate=None):
-        self._cs = cs
-        self._cb = cb
-        self._ps = ps
-        self._pb = pb
-        self._underlying = underlying
-        self._volatility = volatility
-        self._interestRate = interestRate
-        self._expireDate = expireDate
-        self._props = {}
-        self._prop_ranks = {}   
-        self._prop_orders = {}
-        logging.info(f"Candidate(cs={cs}, cb={cb}, ps={ps}, pb={pb})")
-
-        # expected props when cs, cb, ps, and pb are defined:
-        # tc
-        # et
-        # width
-        # tc_w
-        # ml
-        # tc_u
-        # symm
-        
-        if cs and cb and not ps and not pb:
-            tcc = cs.price - cb.price
-            width = cb.strike - cs.strike
-            if not width:
-                return
-            delta_cc = 1.0 - cs.delta
-            delta_cch = tcc * (cs.delta - cb.delta)/width
-            delta_clh = cs.delta - cb.delta - delta_cch
-            bevenc = 100 * (delta_cc + delta_cch)
-            cl = width - tcc
-            ecc = tcc * delta_cc
-            ecch = 0.5 * tcc * delta_cch
-            eclh = -0.5 * cl * delta_clh
-            ecl = -cl * cb.delta
-            etc = ecc + ecch + eclh + ecl
-            tcc_w = 100 * (tcc / width)
-            tcc_u = 100 * (tcc / underlying)
-
-            logging.info("******************")
-            logging.info(f"Cand CALL Spread: {cs.strike}/{cb.strike}" )
-            logging.info(f"strike: {cs.strike:8.1f}  {cb.strike:8.1f}" )
-            logging.info(f"delta:  {cs.delta:8.3f}  {cb.delta:8.3f}" )
-            logging.info(f"price:  {cs.price:8.3f}  {cb.price:8.3f}" )
-            logging.info("******************")
-
-            logging.info(f"tcc: {tcc:.3f}")
-            logging.info(f"w: {width:.3f}")
-            logging.info(f"delta_cc: {delta_cc:.3f}  delta_cch: {delta_cch:.3f}  delta_clh: {delta_clh:.3f}")
-            logging.info(f"cl: {cl:.3f}")
-            logging.info(f"ecc: {ecc:.3f}  ecch: {ecch:.3f}  eclh: {eclh:.3f}  ecl: {ecl:.3f}") 
-            logging.info(f"etc: {etc:.3f}")
-            logging.info(f"tcc/w: {tcc_w:.3f}")
-            logging.info(f"tcc/u: {tcc_u:.3f}")
-            logging.info(f"bevenc: {bevenc:.2f}")
-
-            self._props["tcc"] = tcc
-            self._props["width"] = width
-            self._props["tcc_w"] = tcc_w
-            self._props["tcc_u"] = tcc_u
-            self._props["etc"] = etc
-            self._props["bevenc"] = bevenc
-            return
-        elif ps and pb and not cs and not cb:
-            tcp = ps.price - pb.price
-            width = ps.strike - pb.strike
-            if width:
-                tcp_w = 100 * (tcp / width)
-                tcp_u = 100 * (tcp / underlying)
-                delta_pc = 1.0 + ps.delta   #+
-                delta_pch = tcp * (pb.delta - ps.delta) / width #+
-                delta_plh = pb.delta - ps.delta - delta_pch #+
-                bevenp = 100 * (delta_pc + delta_pch)
-                pl = width - tcp
-                epc = tcp * delta_pc
-                epch = 0.5 * tcp * delta_pch
-                eplh = -0.5 * pl * delta_plh
-                epl = pl * pb.delta
-                etp = epc + epch + eplh + epl
-
-                logging.info("******************")
-                logging.info(f"Cand PUT Spread: {ps.strike}/{pb.strike}" )
-                logging.info(f"strike: {ps.strike:8.1f}  {pb.strike:8.1f}" )
-                logging.info(f"delta:  {ps.delta:8.3f}  {pb.delta:8.3f}" )
-                logging.info(f"price:  {ps.price:8.3f}  {pb.price:8.3f}" )
-                logging.info("******************")
-
-                logging.info(f"tcp: {tcp:.3f}")
-                logging.info(f"width: {width:.3f}")
-                logging.info(f"delta_pc: {delta_pc:.3f}  delta_pch: {delta_pch:.3f}  delta_plh: {delta_plh:.3f}")
-                logging.info(f"pl: {pl:.3f}")
-                logging.info(f"epc: {epc:.3f}  epch: {epch:.3f}  eplh: {eplh:.3f}  epl: {epl:.3f}") 
-                logging.info(f"etp: {etp:.3f}")
-                logging.info(f"tcp/w: {tcp_w:.3f}")
-                logging.info(f"tcp/u: {tcp_u:.3f}")
-                logging.info(f"bevenp: {bevenp:.2f}")
-
-                self._props["tcp"] = tcp
-                self._props["width"] = width
-                self._props["tcp_w"] = tcp_w
-                self._props["tcp_u"] = tcp_u
-                self._props["etp"] = etp
-                self._props["bevenp"] = bevenp
-            return
-        elif not cs or not cb or not ps or not pb:
-            logging.warning("unexpected candidate constructor")
-            return
-        
-        # calculations based on cs, cb, ps, and pb being set
-        css = cs.strike
-        csp = cs.price
-        csd = cs.delta
-        cbs = cb.strike
-        cbp = cb.price
-        cbd = cb.delta
-        pss = ps.strike
-        psp = ps.price
-        psd = ps.delta
-         
-        pbs = pb.strike
-        pbp = pb.price
-        pbd = pb.delta 
-        
-        logging.info("******************")
-        logging.info(f"Cand IC: {css}/{cbs}/{pss}/{pbs}" )
-        
-        logging.info(f"strike: {css:8.1f}  {cbs:8.1f}  {pss:8.1f}  {pbs:8.1f}" )
-        logging.info(f"delta:  {csd:8.3f}  {cbd:8.3f}  {psd:8.3f}  {pbd:8.3f}" )
-        logging.info(f"price:  {csp:8.3f}  {cbp:8.3f}  {psp:8.3f}  {pbp:8.3f}" )
- 
-        logging.info("******************")
-        
-        tc = csp - cbp + psp - pbp
-        #width = ((cbs - css) + (pss - pbs)) * 0.5
-        width = cbs - css
-        if cbs-css < psp-pbp:
-            width = psp - pbp
-        symm = csd + cbd + psd + pbd
-
-        logging.info(f"tc: {tc:.3f}")
-        logging.info(f"width: {width:.3f}")
-        
-        logging.info(f"symm: {symm:.3f}")
-        logging.info(f"cbs - css: {(cbs - css):.3f}")
-        logging.info(f"pss - pbs: {(pss - pbs):.3f}")
-      
-        try:
-            etca = tc * (1.0 - csd + psd) 
-            delta_cc = tc * (csd - cbd)/(cbs - css)
-            delta_pc = tc * (psd - pbd)/(pss - pbs) #-
-            delta_cd = csd - cbd - delta_cc
-            delta_pd = psd - pbd - delta_pc #-
-            tcl = cbs - css - tc
-            tpl = pss - pbs - tc
-            beven = 100 * (1.0 - csd + psd + delta_cc - delta_pc) 
-            
-            logging.info(f"d_cc: {delta_cc:.3f}")
-            logging.info(f"d_pc:  {delta_pc:.3f}")   
-            logging.info(f"d_cd: {delta_cd:.3f}")
-            logging.info(f"d_pd: {delta_pd:.3f}")            
-            logging.info(f"tcl:  {tcl:.3f}")            
-            logging.info(f"tpl: {tpl:.3f}")
-            logging.info(f"beven: {beven:.2f}")
-            
-            etcch = 0.5 * tc * delta_cc
-            etpch = -0.5 * tc * delta_pc
-            etcdh = -0.5 * tcl * delta_cd 
-            etpdh = 0.5 * tpl * delta_pd 
-            etcd = -tcl * cbd 
-            etpd = tpl * pbd 
-            et = etca + etcch + etcdh + etpch + etpdh + etcd + etpd
-            
-            
-            """
-            logging.info(f"etca: {etc:.3f}")
-            logging.info(f"ecch: {etcch:.3f}")
-            logging.info(f"epch: {etpch:.3f}")
-            logging.info(f"ecdh: {etcdh:.3f}")
-            logging.info(f"epdh: {etpdh:.3f}")
-            logging.info(f"ecd: {etcd:.3f}")
-            logging.info(f"epd: {etpd:.3f}")
-            
-            logging.info(f"et: {et:.3f}")
-            logging.info(f"tc_u: {tc_u:.4f}")    
-            """
-            tc_w = 100 * (tc / width)
-            tc_u = 100 * (tc / underlying)
-  
-            # set properties
-            self._props["tc"] = tc
-            self._props["width"] = width
-            self._props["et"] = et
-            self._props["tc_w"] = tc_w
-
-            #self._props["symm"] = abs(symm)
-            self._props["tc_u"] = tc_u
-            self._props["beven"] = beven
-        except ZeroDivisionError:
-            logging.info("zerodivisionerror")
-              
+    """
+    one row of a CandidateBlock, the legs, props, ranks and orders all live
+    in the block columns so a candidate is just (block, row)
+    """
+    __slots__ = ("_block", "_row")
+
+    def __init__(self, block, row):
+        self._block = block
+        self._row = row
+
+    @property
+    def block(self):
+        return self._block
+
     def __str__(self):
-        return f"{self._cs}/{self._cb}/{self._pb}/{self._ps}"
+        return f"{self.cs}/{self.cb}/{self.pb}/{self.ps}"
 
     def print_verbose(self, total=None, min_vals=None, max_vals=None):
         #print(candidate.keys())
         print() 
-        if self._cs and self._cb and self._ps and self._pb:
-            print(f"IC: {self._cs.strike}/{self._cb.strike}/{self._ps.strike}/{self._pb.strike}" )
-        elif self._cs and self._cb:
-            print(f"CSpd: {self._cs.strike}/{self._cb.strike}" )
-        elif self._ps and self._pb:
-            print(f"PSpd: {self._ps.strike}/{self._pb.strike}" )
-
-        if self._cs:
-            print("cs:", self._cs)
-        if self._cb:
-            print("cb:", self._cb)
-        if self._ps:
-            print("ps:", self._ps)
-        if self._pb:
-            print("pb:", self._pb)
+        if self.cs and self.cb and self.ps and self.pb:
+            print(f"IC: {self.strikes()}" )
+        elif self.cs and self.cb:
+            print(f"CSpd: {self.strikes()}" )
+        elif self.ps and self.pb:
+            print(f"PSpd: {self.strikes()}" )
+
+        if self.cs:
+            print("cs:", self.cs)
+        if self.cb:
+            print("cb:", self.cb)
+        if self.ps:
+            print("ps:", self.ps)
+        if self.pb:
+            print("pb:", self.pb)
         print("----")
 
         if PRINT_PROPS:
@@ -379,7 +421,7 @@ class Candidate:
             propnames.sort()
 
         for propname in propnames:
-            if not propname in self._props:
+            if not self.has_prop(propname):
                 continue
             propval = self.get_prop(propname)
             proprank = self.get_rank(propname)
@@ -408,194 +450,100 @@ class Candidate:
             print(s)
 
         """    
-        if self._cs and self._ps:
-            ssymm = self._cs.delta + self._ps.delta
+        if self.cs and self.ps:
+            ssymm = self.cs.delta + self.ps.delta
             print(f"sell symm: {ssymm:.3f} ")
         """
 
+    def strikes(self):
+        # leg strikes as printed, cs/cb/ps/pb for an IC
+        return "/".join([f"{option.strike}" for option in (self.cs, self.cb, self.ps, self.pb) if option])
+
     @property
     def cs(self):
-        return self._cs
+        return self._block.option("cs", self._row)
 
     @property
     def cb(self):
-        return self._cb
+        return self._block.option("cb", self._row)
 
     @property
     def pb(self):
-        return self._pb
+        return self._block.option("pb", self._row)
 
     @property
     def ps(self):
-        return self._ps
+        return self._block.option("ps", self._row)
 
     @property
     def underlying(self):
-        return self._underlying
+        return self._block.contracts["underlying"]
 
     @property
     def volatility(self):
-        return self._volatility
+        return self._block.contracts["volatility"]
 
     @property
     def interestRate(self):
-        return self._interestRate
+        return self._block.contracts["interestRate"]
 
     @property
     def expireDate(self):
-        return self._expireDate
+        return self._block.contracts["expireDate"]
 
     def get_props(self):
-        return self._props.keys()
+        return self._block.props.keys()
 
     def get_prop(self, propname):
-        if propname in self._props:
-            return self._props[propname]
+        if propname in self._block.props:
+            return self._block.props[propname][self._row].item()
          
         logging.warning(f"get_prop unexpected propname: [{propname}]")
 
     def has_prop(self, propname):
-        return propname in self._props
+        return propname in self._block.props
          
     def set_prop(self, propname, value):
-        if propname in self._props:
-            self._props[propname] = value
+        if propname in self._block.props:
+            self._block.props[propname][self._row] = value
+            return
         logging.warning(f"set_prop unexpected propname: [{propname}]")
          
 
     def get_rank(self, propname):
-        if propname not in self._props:
+        if propname not in self._block.props:
             logging.error(f"get_rank, unexpected propname: {propname}")
             return None
-        if propname not in self._prop_ranks:
+        if propname not in self._block.ranks or not self._block.ranks[propname][self._row]:
             logging.warning(f"rank not set for {propname}")
             return None
-        return self._prop_ranks[propname]
+        return int(self._block.ranks[propname][self._row])
  
 
     def set_rank(self, propname, value):
-        if propname not in self._props:
+        if propname not in self._block.props:
             logging.error(f"set_rank, unexpected propname: {propname}")
             return 
         
-        self._prop_ranks[propname] = value
+        self._block.rank_column(propname)[self._row] = value
          
     def get_order(self, propname):
-        if propname not in self._props:
+        if propname not in self._block.props:
             logging.error(f"get_order, unexpected propname: {propname}")
             return None
-        if propname not in self._prop_orders:
+        if propname not in self._block.orders or not self._block.orders[propname][self._row]:
             logging.warning(f"order not set for {propname}")
             return None
-        return self._prop_orders[propname]
+        return int(self._block.orders[propname][self._row])
     
     def set_order(self, propname, value):
-        if propname not in self._props:
+        if propname not in self._block.props:
             logging.error(f"set_order, unexpected propname: {propname}")
             return
         
-        self._prop_orders[propname] = value
-
-    def meets_requirements(self):
-        logging.info(f"requirements check")
-
-        if self._cs and self._cb and self._ps and self._pb:
-            # IC
-
-            for propname in ("et", "tc", "tc_w", "tc_u"):
-                if propname not in self._props:
-                    logging.info(f"meet_requirements, {propname} not set")
-                    return False
-
-            et = self._props["et"]
-            tc = self._props["tc"]
-            tc_w = self._props["tc_w"]
-            tc_u = self._props["tc_u"]
-
-            if et < MIN_ET:
-                logging.debug(f"BAD et: {et} < {MIN_ET}")
-                return False
-
-            if tc < MIN_TC:
-                logging.debug(f"BAD tc: {tc} < {MIN_TC}")
-                return False
-                
-            if tc_w < MIN_TCW:
-                logging.info(f"BAD tcw check: {tc_w} < {MIN_TCW}")
-                return False
-
-            if tc_u < MIN_TCU:
-                logging.info(f"BAD tcu: {tc_u} < {MIN_TCW}")
-                return False
-
-            """
-            if self._ps.strike - self._pb.strike <= tc:
-                logging.info(f"BAD tail: put < tc {tc}")
-                return False   
-        
-            if self._cb.strike - self._cs.strike <= tc:
-                logging.info(f"BAD tail: call < tc {tc}")
-                return False  
-            """
-        elif self._cs and self._cb:
-            # call spread
-            for propname in ("etc", "tcc", "tcc_w", "tcc_u"):
-                if propname not in self._props:
-                    logging.info(f"meet_requirements, {propname} not set")
-                    return False
-
-            etc = self._props["etc"]
-            tcc = self._props["tcc"]
-            tcc_w = self._props["tcc_w"]
-            tcc_u = self._props["tcc_u"]
-
-            if etc < MIN_ET:
-                logging.info(f"BAD etc: {etc} < {MIN_ET}")
-                return False
-
-            if tcc < MIN_TC:
-                logging.info(f"BAD tcc: {tcc} < {MIN_TC}")
-                return False
-        
-            if tcc_u < MIN_TCU:
-                logging.info(f"BAD tcu: {tcc_u} < {MIN_TCW}")
-                return False
-
-            if tcc_w < MIN_TCW:
-                logging.info(f"BAD tcw check: {tcc_w} < {MIN_TCW}")
-                return False
-
-        elif self._ps and self._pb:
-            # put spread
-            for propname in ("etp", "tcp", "tcp_w", "tcp_u"):
-                if propname not in self._props:
-                    logging.info(f"meet_requirements, {propname} not set")
-                    return False
-
-            etp = self._props["etp"]
-            tcp = self._props["tcp"]
-            tcp_w = self._props["tcp_w"]
-            tcp_u = self._props["tcp_u"]
-                    
-            if etp < MIN_ET:
-                logging.info(f"BAD etp: {etp} < {MIN_ET}")
-                return False
-
-            if tcp < MIN_TC:
-                logging.info(f"BAD tcp: {tcp} < {MIN_TC}")
-                return False
-
-            if tcp_w < MIN_TCW:
-                logging.info(f"BAD tcpw check: {tcp_w} < {MIN_TCW}")
-                return False
+        self._block.order_column(propname)[self._row] = value
 
-            if tcp_u < MIN_TCU:
-                logging.info(f"BAD tcpu: {tcp_u} < {MIN_TCW}")
-                return False
-    
-        return True
 
-        
 def printCandidates(candidates):
     total = len(candidates)
     # propnames = ("et", "ml", "width", "tc_w", "tc", "symm", "tc_u", "tcc", "tcc_w")
@@ -624,34 +572,285 @@ def printCandidates(candidates):
         candidate.print_verbose(total=total, min_vals=min_vals, max_vals=max_vals)
         print("------------")
 
+def result_record(symbol, kind, contracts, candidates, count):
+    """
+    structured result of a run for --record: the candidate count, and the candidate
+    with the highest et (etc, etp) for the kind, ties go to the first one printed
+    """
+    record = {}
+    record["symbol"] = symbol
+    record["kind"] = kind
+    record["runtime"] = datetime.now().isoformat(timespec="seconds")
+    record["underlying"] = float(contracts["underlying"])
+    record["volatility"] = float(contracts["volatility"])
+    record["interestRate"] = float(contracts["interestRate"])
+    record["expireDate"] = contracts["expireDate"]
+    record["count"] = count
+    record["best"] = None
+    best_key = RECORD_BEST_KEYS[kind]
+    if candidates and candidates[0].has_prop(best_key):
+        best = max(candidates, key=lambda candidate: candidate.get_prop(best_key))
+        record["best"] = {"strikes": best.strikes()}
+        for propname in best.get_props():
+            record["best"][propname] = best.get_prop(propname)
+    return record
+
+def save_record(filename, record):
+    # one json line per run, make_summary.py reads them back
+    with open(filename, "a") as f:
+        print(json.dumps(record), file=f)
+
+class TokenBucket:
+    # rate limiter shared by the fetch threads, take() waits for a token
+    def __init__(self, rate, capacity):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._time) * self._rate)
+                self._time = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class ChainFetcher:
+    """
+    chain api client: one pooled session and auth token for all requests, at most
+    rate requests per second, and retries with exponential backoff on RETRY_STATUS
+    answers and connection errors
+    """
+
+    def __init__(self, url=CHAINS_URL, concurrency=FETCH_CONCURRENCY, rate=FETCH_RATE,
+            retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+        self.url = url
+        self.concurrency = concurrency
+        self._retries = retries
+        self._backoff = backoff
+        self._bucket = TokenBucket(rate, max(1, concurrency))
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update(get_headers())
+
+    def get(self, params):
+        # the response of the first non retryable answer, None when the retries run out
+        for attempt in range(self._retries + 1):
+            self._bucket.take()
+            delay = self._backoff * 2 ** attempt
+            try:
+                rsp = self._session.get(self.url, params=params, timeout=FETCH_TIMEOUT)
+            except requests.RequestException as e:
+                logging.warning(f"{params['symbol']}: request failed: {e}")
+            else:
+                if rsp.status_code not in RETRY_STATUS:
+                    return rsp
+                logging.warning(f"{params['symbol']}: got status code: {rsp.status_code}")
+                retry_after = rsp.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            if attempt < self._retries:
+                time.sleep(delay)
+        return None
+
+    def fetch(self, symbol, dt_min, dt_max):
+        params = {}
+        params["symbol"] = symbol
+        params["strikeCount"] = 200
+        params["includeQuotes"] = True
+        params["strategy"] = "ANALYTICAL"
+        params["interval"] = 1
+        params["fromDate"] = f"{dt_min.year}-{dt_min.month}-{dt_min.day}"
+        params["toDate"] = f"{dt_max.year}-{dt_max.month}-{dt_max.day}"
+        logging.info(f"fromDate: {dt_min.year}-{dt_min.month}-{dt_min.day}")
+        logging.info(f"toDate: {dt_max.year}-{dt_max.month}-{dt_max.day}")
+        params["daysToExpiration"] = 45
+        rsp = self.get(params)
+        if rsp is None:
+            logging.error(f"{symbol}: no answer after {self._retries} retries")
+            return None
+        if rsp.status_code != 200:
+            logging.error(f"got bad status code: {rsp.status_code}")
+            return None
+        try:
+            rsp_json = decode_chain_response(rsp.content.decode())
+            status = rsp_json["status"]
+        except (ValueError, KeyError) as e:
+            logging.error(f"{symbol}: bad chain response: {e!r}")
+            return None
+        if status == "FAILED":
+            logging.error("got FAILED status")
+            return None
+        #logging.info(rsp_json)
+        store_raw_response(symbol, params, rsp.content)
+        return rsp_json
+
+    def fetch_all(self, symbols, dt_min, dt_max):
+        """
+        (symbol, chains) of each symbol in order, up to concurrency requests are in
+        flight and at most twice that many answers wait to be taken
+        """
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            pending = collections.deque()
+            for symbol in symbols:
+                pending.append((symbol, executor.submit(self.fetch, symbol, dt_min, dt_max)))
+                if len(pending) >= 2 * self.concurrency:
+                    yield self._result(*pending.popleft())
+            while pending:
+                yield self._result(*pending.popleft())
+
+    def _result(self, symbol, future):
+        # (symbol, chains), chains None when the fetch failed, the other symbols go on
+        try:
+            return (symbol, future.result())
+        except Exception:
+            logging.exception(f"{symbol}: fetch failed")
+            return (symbol, None)
+
+# per process ChainFetcher, made on first use
+FETCHER = {}
+FETCHER_LOCK = threading.Lock()
+
+def chain_fetcher():
+    with FETCHER_LOCK:
+        if "fetcher" not in FETCHER:
+            FETCHER["fetcher"] = ChainFetcher(CHAINS_URL, FETCH_CONCURRENCY, FETCH_RATE, FETCH_RETRIES, FETCH_BACKOFF)
+        return FETCHER["fetcher"]
+
 def get_chains(symbol, dt_min, dt_max):
-    
-    headers = get_headers()
-    params = {}
-    params["symbol"] = symbol
-    params["strikeCount"] = 200
-    params["includeQuotes"] = True
-    params["strategy"] = "ANALYTICAL"
-    params["interval"] = 1
-    params["fromDate"] = f"{dt_min.year}-{dt_min.month}-{dt_min.day}"
-    params["toDate"] = f"{dt_max.year}-{dt_max.month}-{dt_max.day}"
-    logging.info(f"fromDate: {dt_min.year}-{dt_min.month}-{dt_min.day}")
-    logging.info(f"toDate: {dt_max.year}-{dt_max.month}-{dt_max.day}")
-    params["daysToExpiration"] = 45
-    req = "https://api.tdameritrade.com/v1/marketdata/chains"
-    rsp = requests.get(req, params=params, headers=headers)
-    if rsp.status_code != 200:
-        logging.error(f"got bad status code: {rsp.status_code}")
+    return chain_fetcher().fetch(symbol, dt_min, dt_max)
+
+def store_raw_response(symbol, params, content):
+    # keep the raw response so it can be replayed (--replay) without calling the api
+    digest = hashlib.sha256(content).hexdigest()
+    object_dir = f"{RAW_STORE_DIR}/objects/{digest[:2]}"
+    os.makedirs(object_dir, exist_ok=True)
+    filename = f"{object_dir}/{digest}.json.gz"
+    if not os.path.isfile(filename):
+        with gzip.open(filename + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(filename + ".tmp", filename)
+    record = {}
+    record["timestamp"] = time.time()
+    record["symbol"] = symbol
+    record["params"] = params
+    record["sha256"] = digest
+    record["size"] = len(content)
+    with open(f"{RAW_STORE_DIR}/{symbol}.jsonl", "a") as f:
+        print(json.dumps(record), file=f)
+
+def load_raw_response(symbol, timestamp=None):
+    """
+    chain response of symbol stored nearest to timestamp, default the most recent
+    returns None if nothing is stored
+    """
+    index_file = f"{RAW_STORE_DIR}/{symbol}.jsonl"
+    if not os.path.isfile(index_file):
         return None
-    rsp_json = rsp.json()
-    if rsp_json["status"] == "FAILED":
-        logging.error("got FAILED status")
+    with open(index_file) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
         return None
-    #logging.info(rsp_json)
-    return rsp_json
+    if timestamp is None:
+        record = records[-1]
+    else:
+        record = min(records, key=lambda record: abs(record["timestamp"] - timestamp))
+    record_time = datetime.fromtimestamp(record["timestamp"])
+    print(f"replay {symbol} response {record['sha256'][:12]} fetched {record_time.isoformat(timespec='seconds')}")
+    with gzip.open(f"{RAW_STORE_DIR}/objects/{record['sha256'][:2]}/{record['sha256']}.json.gz") as f:
+        return decode_chain_response(f.read().decode())
+
+def json_skip(text, pos):
+    # end of the json value that starts at pos, containers are skipped without decoding them
+    if text[pos] not in "{[":
+        (value, pos) = JSON_DECODER.raw_decode(text, pos)
+        return pos
+    depth = 0
+    while True:
+        pos = JSON_FLAT.match(text, pos).end()
+        ch = text[pos]
+        pos += 1
+        if ch in "{[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+def json_members(text, pos):
+    # (key, position of the value) of each member of the json object at pos, the caller moves pos past the value
+    pos = JSON_SPACE.match(text, pos).end()
+    if text[pos] != "{":
+        raise ValueError(f"expected json object at {pos}")
+    pos = JSON_SPACE.match(text, pos + 1).end()
+    while text[pos] != "}":
+        (key, pos) = JSON_DECODER.raw_decode(text, pos)
+        pos = JSON_SPACE.match(text, pos).end()
+        if text[pos] != ":":
+            raise ValueError(f"expected ':' at {pos}")
+        pos = JSON_SPACE.match(text, pos + 1).end()
+        end = yield (key, pos)
+        pos = JSON_SPACE.match(text, end).end()
+        if text[pos] == ",":
+            pos = JSON_SPACE.match(text, pos + 1).end()
+    yield (None, pos + 1)
+
+def decode_exp_date_map(text, pos):
+    """
+    decode the first expiration of an exp date map, the one get_options() uses,
+    keeping only the OPTION_PROPS of its options, the other expirations are skipped
+    returns ({expDate: {strikePrice: [option]}}, end of the map)
+    """
+    option_map = {}
+    members = json_members(text, pos)
+    (key, pos) = next(members)
+    while key is not None:
+        if option_map:
+            end = json_skip(text, pos)
+        else:
+            (bundle, end) = JSON_DECODER.raw_decode(text, pos)
+            for strikePrice in bundle:
+                bundle[strikePrice] = [{propname: option[propname] for propname in OPTION_PROPS} for option in bundle[strikePrice]]
+            option_map[key] = bundle
+        (key, pos) = members.send(end)
+    return (option_map, pos)
+
+def decode_chain_response(text):
+    """
+    decode a chain response without building its whole tree: the top level numbers and
+    strings, and the first expiration of the exp date maps, nested values like the
+    underlying quote are skipped
+    raises ValueError on text that is not a json object, like json.loads
+    """
+    chains = {}
+    try:
+        members = json_members(text, 0)
+        (key, pos) = next(members)
+        while key is not None:
+            if key in ("putExpDateMap", "callExpDateMap"):
+                (chains[key], end) = decode_exp_date_map(text, pos)
+            elif text[pos] in "{[":
+                end = json_skip(text, pos)
+            else:
+                (chains[key], end) = JSON_DECODER.raw_decode(text, pos)
+            (key, pos) = members.send(end)
+    except IndexError:
+        raise ValueError(f"unexpected end of json at {len(text)}") from None
+    return chains
 
 def get_options(option_map, underlying):
-    results = []
+    columns = {}
+    for propname in OPTION_PROPS:
+        columns[propname] = []
     expire_date = None
     option_symbol = None
     for expDate in option_map:
@@ -689,18 +888,17 @@ def get_options(option_map, underlying):
                     sys.exit(1)
                  
                 #price = (option["bid"] + option["ask"])/2.0
-                item = Option(option)
-
-                results.append(item)
+                for propname in OPTION_PROPS:
+                    columns[propname].append(option[propname])
     
     # remove the :nn from expire date 
     # e.g.: 2020-03-20:47 -> 2020-03-20
     n = expire_date.find(":")
     if n > 0:
         expire_date = expire_date[:n]
-    return (results, expire_date)
+    return (OptionChain(columns), expire_date)
     
-def get_contracts(symbol, chains):
+def get_contracts(symbol, chains, save=True):
     underlying = chains["underlyingPrice"]
     volatility = chains["volatility"]
     interestRate = chains["interestRate"]
@@ -714,14 +912,25 @@ def get_contracts(symbol, chains):
     logging.info(f"got {len(call_options)} call options, expire_date: {call_expire_date}")
     if put_expire_date != call_expire_date:
         logging.error("expected put expire date to equal call expire date")
-        sys.exit(1)
+        return None
+
+    retval = {}
+    retval["underlying"] = underlying
+    retval["volatility"] = volatility
+    retval["interestRate"] = interestRate
+    retval["expireDate"] = put_expire_date
+    retval["call"] = call_options
+    retval["put"] = put_options
+    if not save:
+        return retval
+
     # save options to file
     today_ds = get_dateString()
     stock_dir = f"data/{symbol}"
     if not os.path.isdir(stock_dir):
         os.mkdir(stock_dir)
     filename = f"{stock_dir}/{symbol}-{today_ds}.txt"
-    #run_time = datetime.fromtimestamp(time.time())
+    dt = datetime.fromtimestamp(time.time())
     with open(filename, 'w') as f:
         print(f"{symbol}, runtime: {dt.year}/{dt.month:02}/{dt.day:02} {dt.hour:02}:{dt.minute:02}")
         print(f"{symbol}, underlying: {underlying:12.3f}", file=f)
@@ -739,80 +948,797 @@ def get_contracts(symbol, chains):
 
         print(header, file=f)
 
-        options = []
-        for option in put_options:
-            options.append(option)
-        for option in call_options:
-            options.append(option)
-       
-        for option in options:   
-            textline = f"{option.desc:40},"
+        for options in (put_options, call_options):
+            descs = options.desc.tolist()
+            columns = []
             for propname in OPTION_PROPS[1:]:
                 if propname == "daysToExpiration":
                     continue
-                propval = option.getProp(propname)
-                #print(f"got propname: {propname} propval: {propval}")
-                if isinstance(propval, float):
-                    textline += f"{propval:12.3f},"
-                elif isinstance(propval, str):
-                    textline += f"{propval[:12]:>12},"
-                else:
-                    textline += f"{propval:>12},"
+                columns.append(options.column(propname).tolist())
+
+            for i in range(len(options)):
+                textline = f"{descs[i]:40},"
+                for column in columns:
+                    propval = column[i]
+                    #print(f"got propname: {propname} propval: {propval}")
+                    if isinstance(propval, float):
+                        textline += f"{propval:12.3f},"
+                    elif isinstance(propval, str):
+                        textline += f"{propval[:12]:>12},"
+                    else:
+                        textline += f"{propval:>12},"
+
+                print(textline, file=f)
+
+    meta = {}
+    meta["symbol"] = symbol
+    meta["underlying"] = underlying
+    meta["volatility"] = volatility
+    meta["interestRate"] = interestRate
+    meta["expireDate"] = put_expire_date
+    meta["daysToExpiration"] = daysToExpiration
+    meta["timestamp"] = time.time()
+    data = snapshot_bytes(meta, put_options, call_options)
+    with open(f"{stock_dir}/{symbol}-{today_ds}.snap", "wb") as f:
+        f.write(data)
+    append_snapshot_log(symbol, meta["timestamp"], data)
+
+    entry = {}
+    entry["date"] = today_ds
+    entry["file"] = f"{symbol}-{today_ds}"
+    entry["rows"] = len(put_options) + len(call_options)
+    entry["expireDate"] = put_expire_date
+    entry["underlying"] = underlying
+    update_manifest(symbol, entry)
+    return retval   
 
-            print(textline, file=f)
-         
+def snapshot_align(size):
+    return (size + 7) // 8 * 8
+
+def snapshot_bytes(meta, put_options, call_options):
+    """
+    binary columnar version of the text snapshot, every OPTION_PROPS column is
+    stored as one typed block holding the puts followed by the calls, fixed point
+    columns keep their int32 values and note their scale
+    the length is a multiple of 8 so snapshots can be appended back to back
+    """
+    header = dict(meta)
+    header["nput"] = len(put_options)
+    header["ncall"] = len(call_options)
+    columns = {}
+    for propname in OPTION_PROPS:
+        if not put_options.has_column(propname) or not call_options.has_column(propname):
+            continue
+        columns[propname] = np.concatenate([put_options.stored_column(propname), call_options.stored_column(propname)])
+    return table_bytes(header, columns, put_options.scales)
+
+def table_bytes(header, columns, scales=None):
+    # header and 8 byte aligned little endian column blocks, the layout of the binary snapshot
+    header = dict(header)
+    header["columns"] = []
+    arrays = []
+    offset = 0
+    for name in columns:
+        array = columns[name]
+        if array.dtype.kind == "U":
+            array = array.astype(f"<U{max(array.dtype.itemsize // 4, 1)}")
+        else:
+            array = array.astype(array.dtype.newbyteorder("<"))
+        column = {"name": name, "dtype": array.dtype.str, "offset": offset}
+        if scales and name in scales:
+            column["scale"] = scales[name]
+        header["columns"].append(column)
+        arrays.append(array)
+        offset += snapshot_align(array.nbytes)
+
+    data = json.dumps(header).encode()
+    parts = [SNAPSHOT_MAGIC, struct.pack("<I", len(data)), data]
+    size = len(SNAPSHOT_MAGIC) + 4 + len(data)
+    parts.append(bytes(snapshot_align(size) - size))
+    for array in arrays:
+        parts.append(array.tobytes())
+        parts.append(bytes(snapshot_align(array.nbytes) - array.nbytes))
+    return b"".join(parts)
+
+def read_snapshot_header(filename, offset=0):
+    # metadata of a binary snapshot starting at offset, only the header is read
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            logging.error(f"{filename} is not an option snapshot")
+            return None
+        (size,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(size))
+    header["data_start"] = offset + snapshot_align(len(SNAPSHOT_MAGIC) + 4 + size)
+    return header
+
+def load_snapshot(filename, offset=0):
+    """
+    load a binary snapshot starting at offset, the columns are views of the memory mapped file
+    """
+    header = read_snapshot_header(filename, offset)
+    if not header:
+        return None
+    nput = header["nput"]
+    count = nput + header["ncall"]
+    buf = np.memmap(filename, dtype=np.uint8, mode="r")
+    calls = {}
+    puts = {}
+    scales = {}
+    for column in header["columns"]:
+        array = np.frombuffer(buf, dtype=column["dtype"], count=count, offset=header["data_start"] + column["offset"])
+        puts[column["name"]] = array[:nput]
+        calls[column["name"]] = array[nput:]
+        if "scale" in column:
+            scales[column["name"]] = column["scale"]
+
+    calls = OptionChain(calls, scales)
+    puts = OptionChain(puts, scales)
+    logging.info(f"loaded {len(calls)} calls and {len(puts)} puts from snapshot")
     retval = {}
-    retval["underlying"] = underlying
-    retval["volatility"] = volatility
-    retval["interestRate"] = interestRate
-    retval["expireDate"] = put_expire_date
-    retval["call"] = call_options
-    retval["put"] = put_options
-    return retval   
+    retval["underlying"] = header["underlying"]
+    retval["interestRate"] = header["interestRate"]
+    retval["volatility"] = header["volatility"]
+    retval["expireDate"] = header["expireDate"]
+    retval["call"] = calls
+    retval["put"] = puts
+    return retval
 
-def get_data_filename(symbol,dt_min=None, dt_max=None, useold=False):
+def archive_stream(codec, f, mode):
+    # compressed stream over the open file f, stdlib codecs only
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=f, mode=mode)
+    elif codec == "lzma":
+        return lzma.LZMAFile(f, mode=mode)
+    raise ValueError(f"unknown archive codec: {codec}")
+
+def shuffle_bytes(array):
+    # byte planes of a fixed size column: all first bytes, then all second bytes, ...
+    return array.view(np.uint8).reshape(len(array), array.dtype.itemsize).T.tobytes()
+
+def unshuffle_bytes(payload, dtype, count):
+    planes = np.frombuffer(payload, dtype=np.uint8).reshape(dtype.itemsize, count)
+    return planes.T.copy().view(dtype).reshape(count)
+
+def encode_column(propname, array):
+    """
+    column header and payload for the archive
+      description: dictionary of the space separated words, each row a list of word ids
+      other strings: dictionary of the values, each row a value id
+      floats: scaled to integers when that is exact, strikePrice as deltas of the scaled values
+      numbers: byte planes of the little endian values
+    """
+    column = {"name": propname, "dtype": array.dtype.str}
+    if propname == "description":
+        words = {}
+        counts = []
+        ids = []
+        for desc in array.tolist():
+            row = desc.split(" ")
+            counts.append(len(row))
+            for word in row:
+                ids.append(words.setdefault(word, len(words)))
+        column["encoding"] = "words"
+        column["dictionary"] = list(words.keys())
+        payload = np.array(counts, dtype="<u2").tobytes() + np.array(ids, dtype="<u4").tobytes()
+    elif array.dtype.kind == "U":
+        (values, codes) = np.unique(array, return_inverse=True)
+        column["encoding"] = "dictionary"
+        column["dictionary"] = values.tolist()
+        payload = codes.astype("<u4").tobytes()
+    else:
+        array = array.astype(array.dtype.newbyteorder("<"))
+        column["dtype"] = array.dtype.str
+        column["encoding"] = "shuffle"
+        if array.dtype.kind == "f" and np.isfinite(array).all():
+            scaled = np.round(array * ARCHIVE_SCALE).astype(np.int64)
+            # compare bits, -0.0 would come back as 0.0
+            if np.array_equal((scaled / ARCHIVE_SCALE).view(np.int64), array.view(np.int64)):
+                column["encoding"] = "scaled"
+                array = scaled.astype("<i8")
+                if propname == "strikePrice":
+                    column["encoding"] = "delta"
+                    array = np.diff(scaled, prepend=0).astype("<i8")
+        payload = shuffle_bytes(array)
+    column["nbytes"] = len(payload)
+    return (column, payload)
+
+def decode_column(column, payload, count):
+    encoding = column["encoding"]
+    if encoding == "words":
+        counts = np.frombuffer(payload, dtype="<u2", count=count).tolist()
+        words = np.array(column["dictionary"], dtype=object)[np.frombuffer(payload, dtype="<u4", offset=2*count)].tolist()
+        descs = []
+        start = 0
+        for n in counts:
+            descs.append(" ".join(words[start:(start+n)]))
+            start += n
+        return np.array(descs, dtype=column["dtype"])
+    elif encoding == "dictionary":
+        values = np.array(column["dictionary"], dtype=column["dtype"])
+        return values[np.frombuffer(payload, dtype="<u4")]
+    elif encoding == "scaled":
+        return unshuffle_bytes(payload, np.dtype("<i8"), count) / ARCHIVE_SCALE
+    elif encoding == "delta":
+        deltas = unshuffle_bytes(payload, np.dtype("<i8"), count)
+        return np.cumsum(deltas) / ARCHIVE_SCALE
+    return unshuffle_bytes(payload, np.dtype(column["dtype"]), count)
+
+def write_archive(filename, meta, put_options, call_options, codec=ARCHIVE_CODEC):
+    header = dict(meta)
+    header["nput"] = len(put_options)
+    header["ncall"] = len(call_options)
+    header["columns"] = []
+    payloads = []
+    for propname in OPTION_PROPS:
+        if not put_options.has_column(propname) or not call_options.has_column(propname):
+            continue
+        array = np.concatenate([put_options.column(propname), call_options.column(propname)])
+        (column, payload) = encode_column(propname, array)
+        header["columns"].append(column)
+        payloads.append(payload)
+    data = json.dumps(header).encode()
+    with open(filename, "wb") as raw:
+        raw.write(ARCHIVE_MAGIC)
+        raw.write(codec.encode().ljust(8, b"\0"))
+        with archive_stream(codec, raw, "wb") as f:
+            f.write(struct.pack("<I", len(data)))
+            f.write(data)
+            for payload in payloads:
+                f.write(payload)
+
+def read_archive(filename, header_only=False):
+    """
+    stream decode an archive one column at a time
+    returns (header, {propname: array}), the columns are None with header_only
+    """
+    with open(filename, "rb") as raw:
+        if raw.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            logging.error(f"{filename} is not an option snapshot archive")
+            return (None, None)
+        codec = raw.read(8).rstrip(b"\0").decode()
+        with archive_stream(codec, raw, "rb") as f:
+            (size,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(size))
+            if header_only:
+                return (header, None)
+            count = header["nput"] + header["ncall"]
+            columns = {}
+            for column in header["columns"]:
+                columns[column["name"]] = decode_column(column, f.read(column["nbytes"]), count)
+    return (header, columns)
+
+def load_archive(filename):
+    (header, columns) = read_archive(filename)
+    if not header:
+        return None
+    nput = header["nput"]
+    calls = {}
+    puts = {}
+    for propname in columns:
+        puts[propname] = columns[propname][:nput]
+        calls[propname] = columns[propname][nput:]
+
+    calls = OptionChain(calls)
+    puts = OptionChain(puts)
+    logging.info(f"loaded {len(calls)} calls and {len(puts)} puts from archive")
+    retval = {}
+    retval["underlying"] = header["underlying"]
+    retval["interestRate"] = header["interestRate"]
+    retval["volatility"] = header["volatility"]
+    retval["expireDate"] = header["expireDate"]
+    retval["call"] = calls
+    retval["put"] = puts
+    return retval
 
-    # search data files for valid file to load
-    logging.info(f"load_file_file({symbol}, {dt_min}, {dt_max})")
+def same_chains(contracts, other):
+    for option_type in ("call", "put"):
+        chain = contracts[option_type]
+        other_chain = other[option_type]
+        if chain.get_propnames() != other_chain.get_propnames():
+            return False
+        for propname in chain.get_propnames():
+            column = chain.column(propname)
+            other_column = other_chain.column(propname)
+            if column.dtype.kind == "f":
+                # same bits, so nan == nan and -0.0 != 0.0
+                column = column.astype("<f8").view(np.int64)
+                other_column = other_column.astype("<f8").view(np.int64)
+            if not np.array_equal(column, other_column):
+                return False
+    return True
+
+def archive_snapshots(symbol, codec=ARCHIVE_CODEC):
+    """
+    replace the daily .snap/.txt snapshots of symbol by compressed .snapz archives,
+    the originals are removed only once the archive decodes to the same columns
+    the intraday snapshot log is left as it is
+    """
+    manifest = load_manifest(symbol)
+    if not manifest:
+        print(f"no snapshots for {symbol}")
+        return
+    stock_dir = f"data/{symbol}"
+    archived = 0
+    size_before = 0
+    size_after = 0
+    for entry in manifest:
+        datafile = entry["file"]
+        sources = []
+        for extension in (".snap", ".txt"):
+            if os.path.isfile(f"{stock_dir}/{datafile}{extension}"):
+                sources.append(f"{stock_dir}/{datafile}{extension}")
+        if not sources:
+            continue
+        contracts = load_from_file(symbol, datafile)
+        meta = {}
+        meta["symbol"] = symbol
+        meta["underlying"] = contracts["underlying"]
+        meta["volatility"] = contracts["volatility"]
+        meta["interestRate"] = contracts["interestRate"]
+        meta["expireDate"] = contracts["expireDate"]
+        if sources[0].endswith(".snap"):
+            header = read_snapshot_header(sources[0])
+            for name in ("daysToExpiration", "timestamp"):
+                if name in header:
+                    meta[name] = header[name]
+        archive = f"{stock_dir}/{datafile}.snapz"
+        write_archive(archive, meta, contracts["put"], contracts["call"], codec)
+        if not same_chains(contracts, load_archive(archive)):
+            logging.error(f"archive of {datafile} does not match, keeping the snapshot")
+            os.remove(archive)
+            continue
+        for source in sources:
+            size_before += os.path.getsize(source)
+            os.remove(source)
+        size_after += os.path.getsize(archive)
+        archived += 1
+    print(f"archived {archived} snapshots of {symbol}: {size_before} -> {size_after} bytes")
+
+def append_snapshot_log(symbol, timestamp, data):
+    # the snapshot goes to the log before its index record, so the index never points past the log
+    stock_dir = f"data/{symbol}"
+    with open(f"{stock_dir}/{symbol}.log", "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(data)
+    record = np.array([(timestamp, offset, len(data))], dtype=LOG_INDEX_DTYPE)
+    with open(f"{stock_dir}/{symbol}.idx", "ab") as f:
+        f.write(record.tobytes())
+
+def load_snapshot_log(symbol, timestamp):
+    """
+    load the snapshot of the log taken nearest to timestamp, a bisect on the index
+    returns None if there is no log
+    """
+    stock_dir = f"data/{symbol}"
+    index_file = f"{stock_dir}/{symbol}.idx"
+    if not os.path.isfile(index_file):
+        return None
+    count = os.path.getsize(index_file) // LOG_INDEX_DTYPE.itemsize
+    if not count:
+        return None
+    index = np.memmap(index_file, dtype=LOG_INDEX_DTYPE, mode="r", shape=(count,))
+    timestamps = index["timestamp"]
+    n = int(np.searchsorted(timestamps, timestamp))
+    if n == count or (n > 0 and timestamp - timestamps[n-1] <= timestamps[n] - timestamp):
+        n -= 1
+    snapshot_time = datetime.fromtimestamp(timestamps[n])
+    print(f"log snapshot {n+1}/{count} taken {snapshot_time.isoformat(timespec='seconds')}")
+    return load_snapshot(f"{stock_dir}/{symbol}.log", int(index["offset"][n]))
+
+def snapshot_entry(symbol, datafile):
+    # manifest entry read from the header of a snapshot written before there was a manifest
+    stock_dir = f"data/{symbol}"
+    entry = {}
+    entry["date"] = datafile[(len(symbol)+1):]
+    entry["file"] = datafile
+    header = None
+    if os.path.isfile(f"{stock_dir}/{datafile}.snap"):
+        header = read_snapshot_header(f"{stock_dir}/{datafile}.snap")
+    elif os.path.isfile(f"{stock_dir}/{datafile}.snapz"):
+        (header, columns) = read_archive(f"{stock_dir}/{datafile}.snapz", header_only=True)
+    if header:
+        entry["rows"] = header["nput"] + header["ncall"]
+        entry["expireDate"] = header["expireDate"]
+        entry["underlying"] = header["underlying"]
+        return entry
+    with open(f"{stock_dir}/{datafile}.txt") as f:
+        lines = f.read().splitlines()
+    # underlying, volatility, interestRate, expireDate and daysToExpiration lines, then the column header
+    entry["rows"] = len([line for line in lines[6:] if line.strip()])
+    entry["expireDate"] = lines[3][(lines[3].find(":")+1):].strip()
+    entry["underlying"] = float(lines[0][(lines[0].find(":")+1):])
+    return entry
+
+def snapshot_exists(symbol, datafile):
+    # any of the files load_from_file reads
+    stock_dir = f"data/{symbol}"
+    return any(os.path.isfile(f"{stock_dir}/{datafile}{extension}") for extension in (".snap", ".snapz", ".txt"))
+
+def scan_snapshots(symbol, manifest=None):
+    """
+    manifest entries for the snapshots and archives found in data/{symbol},
+    the entries of manifest are kept for the files it lists, so only new files are read
+    """
+    known = {entry["file"]: entry for entry in manifest or []}
+    entries = []
+    datafiles = set()
+    for filename in os.listdir(f"data/{symbol}"):
+        (datafile, extension) = os.path.splitext(filename)
+        if extension in (".snap", ".snapz", ".txt"):
+            datafiles.add(datafile)
+    for datafile in datafiles:
+        n = datafile.find('-')
+        if datafile[:n] != symbol:
+            continue
+        try:
+            datetime.fromisoformat(datafile[(n+1):])
+        except ValueError:
+            continue
+        entries.append(known.get(datafile) or snapshot_entry(symbol, datafile))
+    entries.sort(key=lambda entry: entry["date"])
+    return entries
+
+def save_manifest(symbol, manifest):
+    filename = f"data/{symbol}/{MANIFEST_FILENAME}"
+    with open(filename + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(filename + ".tmp", filename)
+    # not older than the directory after the rename, so a later change of the directory shows
+    os.utime(filename)
+
+def load_manifest(symbol, rescan=False):
+    """
+    snapshot manifest of data/{symbol}: list of {date, file, rows, expireDate, underlying}
+    sorted by date, built from the directory the first time and brought up to date
+    with a rescan when files were added or removed since it was written
+    returns None if there is no data directory
+    """
     stock_dir = f"data/{symbol}"
     if not os.path.isdir(stock_dir):
         return None
-    filenames = os.listdir(stock_dir)
-    datafile = None
+    filename = f"{stock_dir}/{MANIFEST_FILENAME}"
+    if not os.path.isfile(filename):
+        logging.info(f"building snapshot manifest for {symbol}")
+        manifest = scan_snapshots(symbol)
+        save_manifest(symbol, manifest)
+        return manifest
+    with open(filename) as f:
+        manifest = json.load(f)
+    if rescan or os.stat(stock_dir).st_mtime_ns > os.stat(filename).st_mtime_ns:
+        logging.info(f"updating snapshot manifest for {symbol}")
+        manifest = scan_snapshots(symbol, manifest)
+        save_manifest(symbol, manifest)
+    return manifest
+
+def update_manifest(symbol, entry):
+    # add the entry of a new snapshot, replacing an earlier one of the same date
+    manifest = load_manifest(symbol)
+    dates = [item["date"] for item in manifest]
+    n = bisect.bisect_left(dates, entry["date"])
+    if n < len(manifest) and manifest[n]["date"] == entry["date"]:
+        manifest[n] = entry
+    else:
+        manifest.insert(n, entry)
+    save_manifest(symbol, manifest)
+
+def date_number(datestring):
+    # "YYYY-MM-DD" -> YYYYMMDD, the date column of the history
+    return int(datestring.replace("-", ""))
+
+def zone_map(array):
+    # [min, max] of a column section ignoring nan, None if there are no values
+    array = array[~np.isnan(array)]
+    if not len(array):
+        return None
+    return [float(array.min()), float(array.max())]
+
+def compact_partition(symbol, month, entries):
+    """
+    merge the snapshots of one month into a history partition, rows are the puts
+    then the calls, each section in date order
+    returns the history index entry of the partition
+    """
+    stock_dir = f"data/{symbol}"
+    chains = {"put": [], "call": []}
+    dates = []
+    underlyings = []
+    for entry in entries:
+        contracts = load_from_file(symbol, entry["file"])
+        for option_type in chains:
+            chains[option_type].append(contracts[option_type])
+        dates.append(date_number(entry["date"]))
+        underlyings.append(contracts["underlying"])
+
+    # only the columns every snapshot of the month has, older text snapshots lack some
+    propnames = [propname for propname in OPTION_PROPS
+        if all(chain.has_column(propname) for option_type in chains for chain in chains[option_type])]
+    columns = {}
+    columns["date"] = []
+    columns["underlying"] = []
+    for propname in propnames:
+        columns[propname] = []
+    for option_type in ("put", "call"):
+        for (n, chain) in enumerate(chains[option_type]):
+            columns["date"].append(np.full(len(chain), dates[n], dtype=np.int32))
+            columns["underlying"].append(np.full(len(chain), underlyings[n], dtype=float))
+            for propname in propnames:
+                columns[propname].append(chain.column(propname))
+    for name in columns:
+        columns[name] = np.concatenate(columns[name])
+
+    nput = sum(len(chain) for chain in chains["put"])
+    filename = f"{symbol}-history-{month}.hist"
+    header = {"symbol": symbol, "partition": month, "nput": nput, "ncall": len(columns["date"]) - nput}
+    with open(f"{stock_dir}/{filename}.tmp", "wb") as f:
+        f.write(table_bytes(header, columns))
+    os.replace(f"{stock_dir}/{filename}.tmp", f"{stock_dir}/{filename}")
+
+    partition = {}
+    partition["partition"] = month
+    partition["file"] = filename
+    partition["dates"] = [entry["date"] for entry in entries]
+    partition["zones"] = {}
+    for (option_type, start, stop) in (("put", 0, nput), ("call", nput, len(columns["date"]))):
+        zones = {"rows": stop - start}
+        for propname in ZONE_PROPS:
+            if propname in columns:
+                zones[propname] = zone_map(columns[propname][start:stop])
+        partition["zones"][option_type] = zones
+    return partition
+
+def load_history_index(symbol):
+    filename = f"data/{symbol}/{HISTORY_FILENAME}"
+    if not os.path.isfile(filename):
+        return []
+    with open(filename) as f:
+        return json.load(f)
+
+def compact_history(symbol):
+    """
+    merge the daily snapshots of symbol into monthly history partitions,
+    partitions whose snapshot dates did not change are kept as they are
+    """
+    manifest = load_manifest(symbol)
+    if not manifest:
+        print(f"no snapshots for {symbol}")
+        return
+    months = {}
+    for entry in manifest:
+        months.setdefault(entry["date"][:7], []).append(entry)
+    old_index = {}
+    for partition in load_history_index(symbol):
+        old_index[partition["partition"]] = partition
+
+    index = []
+    written = 0
+    for month in sorted(months):
+        entries = months[month]
+        partition = old_index.get(month)
+        if not partition or partition["dates"] != [entry["date"] for entry in entries]:
+            partition = compact_partition(symbol, month, entries)
+            written += 1
+        index.append(partition)
+
+    filename = f"data/{symbol}/{HISTORY_FILENAME}"
+    with open(filename + ".tmp", "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(filename + ".tmp", filename)
+    print(f"compacted {len(manifest)} snapshots of {symbol} into {len(index)} partitions ({written} written)")
+
+def zone_overlaps(zone, value_range):
+    return zone is not None and not (zone[1] < value_range[0] or zone[0] > value_range[1])
+
+def query_history(symbol, columns=None, date_min=None, date_max=None, put_call=None, delta_range=None, strike_range=None):
+    """
+    rows of the compacted history of symbol that pass every given filter
+      date_min, date_max:         "YYYY-MM-DD", inclusive
+      put_call:                   "PUT" or "CALL"
+      delta_range, strike_range:  (min, max), inclusive
+    columns are the names to return (default all), "date" holds YYYYMMDD numbers,
+    only the columns every partition read has are returned, so the rows line up
+    partitions and put/call sections are skipped on their dates and zone maps,
+    and only the asked for and the filter columns of a partition are read
+    returns {name: array}, raises ValueError on an unknown column or put_call
+    """
+    for name in columns or []:
+        if name not in HISTORY_COLUMNS:
+            raise ValueError(f"unknown column: {name}")
+    date_lo = date_number(date_min) if date_min else 0
+    date_hi = date_number(date_max) if date_max else 99999999
+    option_types = ("put", "call")
+    if put_call:
+        if put_call not in ("PUT", "CALL"):
+            raise ValueError(f"unknown option type: {put_call}, expected put or call")
+        option_types = (put_call.lower(),)
+    # {name: rows} of every section read
+    sections = []
+    stock_dir = f"data/{symbol}"
+    for partition in load_history_index(symbol):
+        if date_number(partition["dates"][-1]) < date_lo or date_number(partition["dates"][0]) > date_hi:
+            continue
+        header = None
+        for option_type in option_types:
+            zones = partition["zones"][option_type]
+            if not zones["rows"]:
+                continue
+            if delta_range and not zone_overlaps(zones.get("delta"), delta_range):
+                continue
+            if strike_range and not zone_overlaps(zones.get("strikePrice"), strike_range):
+                continue
+            if header is None:
+                filename = f"{stock_dir}/{partition['file']}"
+                header = read_snapshot_header(filename)
+                buf = np.memmap(filename, dtype=np.uint8, mode="r")
+                count = header["nput"] + header["ncall"]
+                layout = {}
+                for column in header["columns"]:
+                    layout[column["name"]] = column
+                if columns is None:
+                    columns = list(layout.keys())
+
+            def view(name):
+                column = layout[name]
+                return np.frombuffer(buf, dtype=column["dtype"], count=count, offset=header["data_start"] + column["offset"])
+
+            if option_type == "put":
+                (start, stop) = (0, header["nput"])
+            else:
+                (start, stop) = (header["nput"], count)
+            # sections are in date order
+            section_dates = view("date")[start:stop]
+            stop = start + int(np.searchsorted(section_dates, date_hi, side="right"))
+            start = start + int(np.searchsorted(section_dates, date_lo, side="left"))
+            mask = np.ones(stop - start, dtype=bool)
+            if delta_range:
+                delta = view("delta")[start:stop]
+                mask &= (delta >= delta_range[0]) & (delta <= delta_range[1])
+            if strike_range:
+                strike = view("strikePrice")[start:stop]
+                mask &= (strike >= strike_range[0]) & (strike <= strike_range[1])
+            sections.append({name: view(name)[start:stop][mask] for name in columns if name in layout})
+
+    if not sections:
+        return {name: np.zeros(0) for name in (columns or [])}
+    names = [name for name in columns if all(name in section for section in sections)]
+    if len(names) < len(columns):
+        logging.warning(f"columns not in every partition left out: {[name for name in columns if name not in names]}")
+    return {name: np.concatenate([section[name] for section in sections]) for name in names}
+
+def query_range(name, value):
+    # MIN:MAX value of a --query filter
+    bounds = value.split(":")
+    if len(bounds) != 2:
+        raise ValueError(f"{name} has to be MIN:MAX, got: {value}")
+    return (float(bounds[0]), float(bounds[1]))
+
+def print_history_query(symbol, spec):
+    """
+    --query spec, space separated filters:
+      from=YYYY-MM-DD to=YYYY-MM-DD type=put|call delta=MIN:MAX strike=MIN:MAX columns=name,name,...
+    """
+    args = {}
+    columns = ["date", "description", "strikePrice", "delta", "mark"]
+    for field in spec.split():
+        if "=" not in field:
+            raise ValueError(f"expected name=value, got: {field}")
+        (name, value) = field.split("=", 1)
+        if name == "from":
+            args["date_min"] = value
+        elif name == "to":
+            args["date_max"] = value
+        elif name == "type":
+            args["put_call"] = value.upper()
+        elif name == "delta":
+            args["delta_range"] = query_range(name, value)
+        elif name == "strike":
+            args["strike_range"] = query_range(name, value)
+        elif name == "columns":
+            columns = value.split(",")
+        else:
+            raise ValueError(f"unknown query filter: {name}")
+    start_time = time.time()
+    rows = query_history(symbol, columns, **args)
+    elapsed = time.time() - start_time
+    columns = [name for name in columns if name in rows]
+    values = [rows[name].tolist() for name in columns]
+    print(",".join(f"{name:>12}" for name in columns))
+    count = len(values[0]) if values else 0
+    for n in range(count):
+        textline = ""
+        for column in values:
+            value = column[n]
+            if isinstance(value, float):
+                textline += f"{value:12.3f},"
+            else:
+                textline += f"{value:>12},"
+        print(textline)
+    print(f"{count} rows in {elapsed:.3f}s")
+
+def get_data_filename(symbol,dt_min=None, dt_max=None, useold=False):
+
+    # most recent data file dated from dt_min to dt_max, looked up in the manifest
+    logging.info(f"load_file_file({symbol}, {dt_min}, {dt_max})")
+    manifest = load_manifest(symbol)
+    if manifest is None:
+        return None
     logging.info(f"search data files with symbol {symbol} from {dt_min} to {dt_max}")
+    datafile = manifest_datafile(manifest, dt_min, dt_max, useold)
+    if datafile and not snapshot_exists(symbol, datafile):
+        logging.warning(f"{datafile} of the manifest is gone, rescanning data/{symbol}")
+        manifest = load_manifest(symbol, rescan=True)
+        datafile = manifest_datafile(manifest, dt_min, dt_max, useold)
+    return datafile
+
+def manifest_datafile(manifest, dt_min, dt_max, useold):
+    # file of the newest manifest entry dated from dt_min to dt_max
     if not dt_min:
         dt_min = datetime.fromisoformat("1900-01-01")
     if not dt_max:
         dt_max = datetime.fromisoformat("2100-12-31")
-    for filename in filenames:
-        if not filename.endswith(".txt"):
-            continue
-        filename = filename[:-4]  # drop extension
-        n = filename.find('-')
-        file_symbol = filename[:n]
-        datestring = filename[(n+1):]
-        if file_symbol != symbol:
-            continue
-        logging.info(f"looking at file: {filename}")
-        file_date = datetime.fromisoformat(datestring)
-        if file_date >= dt_min and file_date <= dt_max:
-            datafile = filename
-            # keep going to get most recent data file
-    if not datafile:
-        if useold and len(filenames) > 0:
-            # grab the most recent file
-            datafile = filenames[-1]
-        else:
-            logging.info("no datafile found")
+    # files are dated at midnight, so a dt_min later in the day starts at the next date
+    first = dt_min.date()
+    if datetime(year=first.year, month=first.month, day=first.day) < dt_min:
+        first += timedelta(days=1)
+    dates = [entry["date"] for entry in manifest]
+    lo = bisect.bisect_left(dates, first.isoformat())
+    hi = bisect.bisect_right(dates, dt_max.date().isoformat())
+    datafile = None
+    if lo < hi:
+        datafile = manifest[hi-1]["file"]
+    elif useold and manifest:
+        # grab the most recent file
+        datafile = manifest[-1]["file"]
+    else:
+        logging.info("no datafile found")
     return datafile
 
-def load_from_file(datafile):
+def text_schema(propnames):
+    """
+    (field index, propname, dtype) for each OPTION_PROPS column named in the header of a text snapshot
+    strings are kept as written, so the symbol and putCall columns stay truncated to 12 chars
+    """
+    schema = []
+    for (index, propname) in enumerate(propnames):
+        if propname in OPTION_PROPS:
+            schema.append((index, propname, prop_dtype(propname)))
+    return schema
+
+def text_numbers(propname, column, dtype):
+    """
+    numbers of a stripped text snapshot column, one conversion when every field is a number,
+    else field by field with nan for the fields that are not ("", "None"), 0 in an int column
+    int columns go through float, so "516.000" is read as 516
+    """
+    try:
+        values = column.astype(float)
+    except ValueError:
+        values = np.array([text_number(field) for field in column.tolist()], dtype=float)
+        bad = [field for field in column[np.isnan(values)].tolist() if field.lower() != "nan"]
+        logging.warning(f"{propname}: {len(bad)} fields that are not numbers, like [{bad[0]}]")
+    if dtype is not float:
+        values = np.where(np.isnan(values), 0, values).astype(dtype)
+    return values
+
+def text_number(field):
+    try:
+        return float(field)
+    except ValueError:
+        return float("nan")
+
+def load_from_file(symbol, datafile):
 
     underlying = None
-    calls = []
-    puts = []
+    calls = {}
+    puts = {}
     stock_dir = f"data/{symbol}"
 
+    # use the binary snapshot or its archive when there is one
+    if os.path.isfile(stock_dir+"/"+datafile+".snap"):
+        return load_snapshot(stock_dir+"/"+datafile+".snap")
+    if os.path.isfile(stock_dir+"/"+datafile+".snapz"):
+        return load_archive(stock_dir+"/"+datafile+".snapz")
+
     with open(stock_dir+"/"+datafile+".txt") as f:
         line = f.readline().strip()
         # first line should be like: MMM, underlying:      158.630
@@ -834,58 +1760,44 @@ def load_from_file(datafile):
         n = line.find(":")
         daysToExpiration = int(line[(n+1):])
         logging.debug(f"got daysToExpiration: {daysToExpiration}")
-        propnames = []
         # next line should be headers
         line = f.readline().strip()
         if line[0] != '#':
             logging.error(f"expected header line but got: {line}")
             sys.exit(1)
-        line = line[1:]
-        fields = line.split(',')
-        for field in fields:
-            propnames.append(field.strip())
-        
-
-        while line:
-            line = f.readline().strip()
-            if not line: 
-                continue
-
+        propnames = [field.strip() for field in line[1:].split(',')]
+        schema = text_schema(propnames)
+        desc_index = propnames.index("description")
+
+        rows = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                break
             fields = line.split(',')
             if len(fields) != len(propnames):
                 logging.error(f"unexpected line: {line}")
                 continue
-            optionprops = {}
-            for i in range(len(fields)):
-                propname = propnames[i]
-                field = fields[i].strip()
-                if len(field) == 0:
-                    propval = ""
-                else:
-                    field_type = "int"
-                    for ch in field:
-                        if ch == '.' and field_type == "int":
-                            field_type = "float"
-                        elif ch == '-':
-                            pass # ignore, could be neg sign
-                        elif not ch.isdigit():
-                            field_type = "str"
-                    if field_type == "int":
-                        propval = int(field)
-                    elif field_type == "float":
-                        propval = float(field)
-                    else:
-                        propval = field  # just string
-                optionprops[propname] = propval
-                
-            option = Option(optionprops)
-            if descIsPut(option.desc):
-                puts.append(option)
-            elif descIsCall(option.desc):
-                calls.append(option)
-            else:
-                logging.error(f"unexpected desc: [{option.desc}]")
-
+            rows.append(fields)
+
+    fields = list(zip(*rows))
+    if not fields:
+        fields = [()] * len(propnames)
+    descs = np.char.strip(np.array(fields[desc_index], dtype=str))
+    is_put = np.array([descIsPut(desc) for desc in descs.tolist()], dtype=bool)
+    is_call = np.array([descIsCall(desc) for desc in descs.tolist()], dtype=bool) & ~is_put
+    for desc in descs[~(is_put | is_call)].tolist():
+        logging.error(f"unexpected desc: [{desc}]")
+
+    for (index, propname, dtype) in schema:
+        column = np.char.strip(np.array(fields[index], dtype=str))
+        if dtype is not str:
+            column = text_numbers(propname, column, dtype)
+        puts[propname] = column[is_put]
+        calls[propname] = column[is_call]
+
+    calls = OptionChain(calls)
+    puts = OptionChain(puts)
     logging.info(f"loaded {len(calls)} calls and {len(puts)} puts from file")
     retval = {}
     retval["underlying"] = underlying
@@ -897,457 +1809,1318 @@ def load_from_file(datafile):
     return retval
         
 
-def prelimination(cs=None, cb=None, ps=None, pb=None):  
-                     
-    fmt = f"prelimination Checking:"
-    if cs:
-        fmt += f" {cs.strike:.1f}"
-    if cb:
-        fmt += f"/{cb.strike:.1f}"
-    if ps:
-        fmt += f"/{ps.strike:.1f}"
-    if pb:
-        fmt += f"/{pb.strike:.1f}"
-    logging.debug(fmt)
-
-    if cs and cs.strike >= cb.strike:
-        logging.info("BAD prelimination call strike: sell > buy")
-        return False
+class CandidateBlock:
+    """
+    a batch of candidates of one kind (IC, call spread or put spread) stored as columns
+      legs:  "cs", "cb", "ps" and/or "pb" -> option indexes into contracts["call"] / contracts["put"]
+      order: generation order of each candidate, used to break sort ties
+      props: propname -> value array, set by the metrics stage
+      terms: name -> value array, spread terms reused by the IC metrics
+    """
+
+    def __init__(self, contracts, legs, order, props=None, terms=None):
+        self._contracts = contracts
+        self.legs = legs
+        self.order = order
+        if props is None:
+            props = {}
+        self.props = props
+        # partial terms cached by the metrics stage for building ICs from spreads
+        if terms is None:
+            terms = {}
+        self.terms = terms
+        # propname -> rank / order arrays, 0 until set
+        self.ranks = {}
+        self.orders = {}
+
+    def __len__(self):
+        return len(self.order)
 
-    if pb and pb.strike >= ps.strike:
-        logging.info("BAD prelimination put strike: buy > sell")
-        return False
-    
-    if ps and cs and ps.strike >= cs.strike:
-        logging.info("BAD prelimination call/put strikes: put > call")
-        return False
+    @property
+    def contracts(self):
+        return self._contracts
 
-    if cs and cb and cs.price <= cb.price:
-        logging.info("BAD prelimination call price: sell < buy")
-        return False
+    def option(self, leg, row):
+        if leg not in self.legs:
+            return None
+        if leg in ("cs", "cb"):
+            return self._contracts["call"][int(self.legs[leg][row])]
+        else:
+            return self._contracts["put"][int(self.legs[leg][row])]
 
-    if ps and pb and ps.price <= pb.price:
-        logging.info('BAD prelimination put price: sell < buy')
-        return False
+    def rank_column(self, propname):
+        if propname not in self.ranks:
+            self.ranks[propname] = np.zeros(len(self), dtype=np.int64)
+        return self.ranks[propname]
 
-    return True
+    def order_column(self, propname):
+        if propname not in self.orders:
+            self.orders[propname] = np.zeros(len(self), dtype=np.int64)
+        return self.orders[propname]
 
-def check_ic_requirements(ic):
-    if not ic.cs or not ic.cb or not ic.ps or not ic.pb:
-        logging.error(f"invalid ic: {ic}")
-        return False
-    return check_ic_symmetry(ic)
+    @property
+    def kind(self):
+        if "cs" in self.legs and "ps" in self.legs:
+            return "ic"
+        elif "cs" in self.legs:
+            return "call"
+        else:
+            return "put"
 
-def check_ic_symmetry(ic):
-    logging.info(f"IC symmetry check: {ic.cs.strike:.1f}/{ic.cb.strike:.1f}/{ic.ps.strike:.1f}/{ic.pb.strike:.1f}" )
-    
-    if ic.cb.strike - ic.cs.strike > WIDTH_SYMMETRY * (ic.ps.strike - ic.pb.strike):
-        logging.info(f"BAD width ratio call:put {ic.cb.strike - ic.cs.strike} : {ic.ps.strike - ic.pb.strike}")
-        return False
+    def leg_arrays(self, leg):
+        # (strike, price, delta) of the given leg for every candidate
+        if leg in ("cs", "cb"):
+            chain = self._contracts["call"]
+        else:
+            chain = self._contracts["put"]
+        index = self.legs[leg]
+        return (chain.values("strikePrice", index), chain.values("mark", index), chain.delta[index])
+
+    def leg_keys(self, leg):
+        # (strike, price) of the given leg as stored, for the exact comparisons
+        if leg in ("cs", "cb"):
+            chain = self._contracts["call"]
+        else:
+            chain = self._contracts["put"]
+        index = self.legs[leg]
+        return (chain.stored_column("strikePrice")[index], chain.stored_column("mark")[index])
+
+    def select(self, mask):
+        legs = {}
+        for leg in self.legs:
+            legs[leg] = self.legs[leg][mask]
+        props = {}
+        for propname in self.props:
+            props[propname] = self.props[propname][mask]
+        terms = {}
+        for name in self.terms:
+            terms[name] = self.terms[name][mask]
+        return CandidateBlock(self._contracts, legs, self.order[mask], props, terms)
+
+    def candidate(self, n):
+        return Candidate(self, n)
+
+    def rank(self):
+        """
+        set the order and rank of every property in one pass over the columns
+        order follows a stable sort (descending unless in NON_REVERSE_SORT),
+        rank is shared by values within 0.001 of the previous one
+        """
+        count = len(self)
+        positions = np.arange(1, count + 1)
+        for propname in self.props:
+            values = self.props[propname]
+            if propname in NON_REVERSE_SORT:
+                perm = np.argsort(values, kind="stable")
+            else:
+                perm = np.argsort(-values, kind="stable")
+            values = values[perm]
+            # a new rank starts where the previous value is set (non zero) and differs by more than 0.001
+            breaks = np.zeros(count, dtype=bool)
+            breaks[1:] = (values[:-1] != 0) & (np.abs(values[1:] - values[:-1]) > 0.001)
+            ranks = np.maximum.accumulate(np.where(breaks, positions, 1))
+            self.order_column(propname)[perm] = positions
+            self.rank_column(propname)[perm] = ranks
+
+    def sorted_candidates(self, propname):
+        # candidates by their order for propname, rank() has to be called first
+        rows = np.argsort(self.order_column(propname), kind="stable")
+        return [Candidate(self, int(n)) for n in rows]
+
+    def candidates(self):
+        return [Candidate(self, n) for n in range(len(self))]
+
+
+def concat_blocks(contracts, legnames, blocks):
+    legs = {}
+    for leg in legnames:
+        legs[leg] = np.concatenate([block.legs[leg] for block in blocks] + [np.zeros(0, dtype=np.int64)])
+    order = np.concatenate([block.order for block in blocks] + [np.zeros(0, dtype=np.int64)])
+    props = {}
+    terms = {}
+    if blocks:
+        for propname in blocks[0].props:
+            props[propname] = np.concatenate([block.props[propname] for block in blocks])
+        for name in blocks[0].terms:
+            terms[name] = np.concatenate([block.terms[name] for block in blocks])
+    return CandidateBlock(contracts, legs, order, props, terms)
 
-    if ic.ps.strike - ic.pb.strike > WIDTH_SYMMETRY * (ic.cb.strike - ic.cs.strike):
-        logging.info(f"BAD width ratio: put:call {ic.ps.strike - ic.pb.strike} : {ic.cb.strike - ic.cs.strike}")
-        return False
 
-    ssymm = ic.cs.delta + ic.ps.delta
-    logging.info(f"sell symm = {ssymm:.3f}")
-    if not abs(ssymm) < SELL_SYMMETRY:
-        logging.info(f"BAD symmetry: sell delta: {abs(ssymm)} < {SELL_SYMMETRY}")
-        return False
+#
+# candidate sinks, the last stage of the search pipeline
+#   add(block) is called with every block of candidates that meet the requirements
+#   result() returns the list of Candidates to rank and print
+#
+class ListSink:
+    # keep every candidate
+    def __init__(self):
+        self._blocks = []
+        self.count = 0
 
-    symm = ic.cs.delta + ic.cb.delta + ic.ps.delta + ic.pb.delta
-    if not abs(symm) < TOTAL_SYMMETRY:
-        logging.info(f"BAD symmetry: over all symm = {ssymm:.3f} < {TOTAL_SYMMETRY}")
-        return False
+    def add(self, block):
+        self._blocks.append(block)
+        self.count += len(block)
 
-    return True      
-
-def check_preq(candidate):
-    if candidate.has_prop("et"):
-        et = candidate.get_prop("et")
-        tc = candidate.get_prop("tc")
-        logging.debug(f"check_preq, got et: {et}, tc: {tc}")
-    elif candidate.has_prop("etc"):
-        et = candidate.get_prop("etc")
-        tc = candidate.get_prop("tcc")
-        logging.debug(f"check_preq, got etc: {et}, tcc: {tc}")      
-    elif candidate.has_prop("etp"):
-        et = candidate.get_prop("etp")
-        #logging.debug(f"propnames: {candidate.get_props()}")
-        tc = candidate.get_prop("tcp")
-        logging.debug(f"check_preq, got etp: {et}, tcp: {tc}")
-    else:
-        logging.warning("expected to find either etc or etp property")
-        return False
-        
-    if tc < MIN_TC:
-        logging.debug("check_preq False -> tc < MIN_TC")
-        return False
-    if et < MIN_ET:
-        logging.debug("check_preq False -> et < MIN_ET")
-        return False
+    def threshold(self):
+        return None
 
-    logging.debug("check_preq True")
-    return True
+    def blocks(self):
+        return self._blocks
+
+    def result(self):
+        if not self._blocks:
+            return []
+        first = self._blocks[0]
+        block = concat_blocks(first.contracts, first.legs.keys(), self._blocks)
+        return block.candidates()
+
+
+class TopSink:
+    # keep the best `top` candidates by the sort key, ties go to the lower generation order
+    def __init__(self, sort_key, top):
+        self._sort_key = sort_key
+        self._top = top
+        if sort_key in NON_REVERSE_SORT:
+            self._sign = -1
+        else:
+            self._sign = 1
+        # min-heap of (sign * value, -order, single row block), heap[0] is the worst kept
+        self._heap = []
+        self.count = 0
+
+    def add(self, block):
+        self.count += len(block)
+        keys = self._sign * block.props[self._sort_key]
+        rows = range(len(block))
+        if len(self._heap) == self._top:
+            rows = np.flatnonzero(keys >= self._heap[0][0])
+        keys = keys.tolist()
+        orders = block.order.tolist()
+        for n in rows:
+            item = (keys[n], -orders[n])
+            if len(self._heap) < self._top:
+                heapq.heappush(self._heap, item + (block.select([n]),))
+            elif item > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, item + (block.select([n]),))
+
+    def threshold(self):
+        # sort key value (times the sort sign) a candidate has to reach to get in
+        if len(self._heap) < self._top:
+            return None
+        return self._heap[0][0]
+
+    def blocks(self):
+        # kept candidates as single row blocks, best first
+        items = sorted(self._heap, key = lambda item: item[:2], reverse=True)
+        return [item[2] for item in items]
+
+    def result(self):
+        if not self._heap:
+            return []
+        blocks = self.blocks()
+        block = concat_blocks(blocks[0].contracts, blocks[0].legs.keys(), blocks)
+        return block.candidates()
+
+
+class CountSink:
+    # only count the candidates
+    def __init__(self):
+        self.count = 0
 
+    def add(self, block):
+        self.count += len(block)
+
+    def threshold(self):
+        return None
+
+    def result(self):
+        return []
+
+
+class CsvSink:
+    # write every candidate to a csv file as it is found
+    def __init__(self, filename):
+        self._filename = filename
+        self._f = open(filename, "w")
+        self._header = None
+        self.count = 0
+
+    def add(self, block):
+        self.count += len(block)
+        legnames = [leg for leg in ("cs", "cb", "ps", "pb") if leg in block.legs]
+        propnames = list(block.props.keys())
+        if self._header is None:
+            self._header = ",".join(legnames + propnames)
+            print(self._header, file=self._f)
+        columns = []
+        for leg in legnames:
+            columns.append(block.leg_arrays(leg)[0].tolist())
+        for propname in propnames:
+            columns.append(block.props[propname].tolist())
+        for n in range(len(block)):
+            print(",".join([str(column[n]) for column in columns]), file=self._f)
+
+    def threshold(self):
+        return None
+
+    def close(self):
+        self._f.close()
+
+    def result(self):
+        self.close()
+        print(f"wrote {self.count} candidates to {self._filename}")
+        return []
+
+
+def put_spread_props(ps, pb, underlying):
+    """
+    vectorized version of the Candidate put spread calculations
+    ps and pb are (strike, price, delta) tuples of arrays that broadcast against each other
+    """
+    (pss, psp, psd) = ps
+    (pbs, pbp, pbd) = pb
+    tcp = psp - pbp
+    width = pss - pbs
+    tcp_w = 100 * (tcp / width)
+    tcp_u = 100 * (tcp / underlying)
+    delta_pc = 1.0 + psd
+    delta_pch = tcp * (pbd - psd) / width
+    delta_plh = pbd - psd - delta_pch
+    bevenp = 100 * (delta_pc + delta_pch)
+    pl = width - tcp
+    epc = tcp * delta_pc
+    epch = 0.5 * tcp * delta_pch
+    eplh = -0.5 * pl * delta_plh
+    epl = pl * pbd
+    etp = epc + epch + eplh + epl
+
+    props = {}
+    props["tcp"] = tcp
+    props["width"] = width
+    props["tcp_w"] = tcp_w
+    props["tcp_u"] = tcp_u
+    props["etp"] = etp
+    props["bevenp"] = bevenp
+    return props
+
+def call_spread_props(cs, cb, underlying):
+    """
+    vectorized version of the Candidate call spread calculations
+    cs and cb are (strike, price, delta) tuples of arrays that broadcast against each other
+    """
+    (css, csp, csd) = cs
+    (cbs, cbp, cbd) = cb
+    tcc = csp - cbp
+    width = cbs - css
+    delta_cc = 1.0 - csd
+    delta_cch = tcc * (csd - cbd)/width
+    delta_clh = csd - cbd - delta_cch
+    bevenc = 100 * (delta_cc + delta_cch)
+    cl = width - tcc
+    ecc = tcc * delta_cc
+    ecch = 0.5 * tcc * delta_cch
+    eclh = -0.5 * cl * delta_clh
+    ecl = -cl * cbd
+    etc = ecc + ecch + eclh + ecl
+    tcc_w = 100 * (tcc / width)
+    tcc_u = 100 * (tcc / underlying)
+
+    props = {}
+    props["tcc"] = tcc
+    props["width"] = width
+    props["tcc_w"] = tcc_w
+    props["tcc_u"] = tcc_u
+    props["etc"] = etc
+    props["bevenc"] = bevenc
+    return props
+
+def put_spread_terms(ps, pb, props):
+    # put spread terms reused by ic_props
+    terms = {}
+    terms["tc"] = props["tcp"]
+    terms["width"] = props["width"]
+    terms["et"] = props["etp"]
+    terms["sell"] = ps[1]
+    terms["buy"] = pb[1]
+    terms["delta"] = ps[2]
+    terms["spread_delta"] = ps[2] - pb[2]
+    return terms
+
+def call_spread_terms(cs, cb, props):
+    # call spread terms reused by ic_props
+    terms = {}
+    terms["tc"] = props["tcc"]
+    terms["width"] = props["width"]
+    terms["et"] = props["etc"]
+    terms["delta"] = 1.0 - cs[2]
+    terms["spread_delta"] = cs[2] - cb[2]
+    return terms
+
+def ic_props(call, put, underlying):
+    """
+    IC props built from the call and put spread terms
+    the tc^2 parts of the IC expectation cancel out, leaving
+      et = tc - 0.5 * (csd - cbd) * cw - cw * cbd + 0.5 * (psd - pbd) * pw + pw * pbd
+    which is etc + etp, equal to the Candidate et up to float rounding (about 1e-15)
+    tc and beven are summed in the order of the Candidate expressions, so tc, tc_w,
+    tc_u and beven come out the same to the bit
+    """
+    tc = call["tc"] + put["sell"] - put["buy"]
+    #width = ((cbs - css) + (pss - pbs)) * 0.5
+    width = np.where(call["width"] < put["tc"], put["tc"], call["width"])
+    et = call["et"] + put["et"]
+    tc_w = 100 * (tc / width)
+    tc_u = 100 * (tc / underlying)
+    beven = 100 * (call["delta"] + put["delta"] + tc * call["spread_delta"] / call["width"]
+        - tc * put["spread_delta"] / put["width"])
+
+    props = {}
+    props["tc"] = tc
+    props["width"] = width
+    props["et"] = et
+    props["tc_w"] = tc_w
+    props["tc_u"] = tc_u
+    props["beven"] = beven
+    return props
+
+def requirements_mask(props, et_name, tc_name):
+    # the candidates with et, tc, tc_w and tc_u (or their spread names) at least MIN_ET, MIN_TC, MIN_TCW, MIN_TCU
+    mask = ~(props[et_name] < MIN_ET)
+    mask &= ~(props[tc_name] < MIN_TC)
+    mask &= ~(props[tc_name + "_w"] < MIN_TCW)
+    mask &= ~(props[tc_name + "_u"] < MIN_TCU)
+    return mask
+
+def prelimination_mask(block):
+    # the candidates with the sell and buy strikes and prices the right way round,
+    # and the put spread below the call spread
+    mask = np.ones(len(block), dtype=bool)
+    legs = {}
+    for leg in block.legs:
+        legs[leg] = block.leg_keys(leg)
+    if "cs" in legs:
+        mask &= ~(legs["cs"][0] >= legs["cb"][0])
+    if "pb" in legs:
+        mask &= ~(legs["pb"][0] >= legs["ps"][0])
+    if "ps" in legs and "cs" in legs:
+        mask &= ~(legs["ps"][0] >= legs["cs"][0])
+    if "cs" in legs and "cb" in legs:
+        mask &= ~(legs["cs"][1] <= legs["cb"][1])
+    if "ps" in legs and "pb" in legs:
+        mask &= ~(legs["ps"][1] <= legs["pb"][1])
+    return mask
+
+def ic_symmetry_mask(cs, cb, ps, pb):
+    # the ICs within WIDTH_SYMMETRY, SELL_SYMMETRY and TOTAL_SYMMETRY,
+    # legs are (strike, price, delta) tuples that broadcast
+    call_width = cb[0] - cs[0]
+    put_width = ps[0] - pb[0]
+    mask = ~(call_width > WIDTH_SYMMETRY * put_width)
+    mask &= ~(put_width > WIDTH_SYMMETRY * call_width)
+    mask &= np.abs(cs[2] + ps[2]) < SELL_SYMMETRY
+    mask &= np.abs(cs[2] + cb[2] + ps[2] + pb[2]) < TOTAL_SYMMETRY
+    return mask
+
+#
+# search pipeline:
+#   leg selection -> pair generation -> prelimination -> metrics -> requirements -> sink
+# every stage is a generator of CandidateBlocks so only one block is alive at a time,
+# peak memory is set by what the sink keeps
+#
+def put_spread_pairs(contracts, ps_range, pb_range):
+    """
+    leg selection and pair generation, one block of ps legs for each pb leg
+    only the ps legs with a strike above the pb strike are paired
+    """
+    chain = contracts["put"]
+    pb_index = chain.delta_band(pb_range)
+    logging.info(f"pb_list count: {len(pb_index)}")
+    ps_index = chain.delta_band(ps_range)
+    logging.info(f"ps_list count: {len(ps_index)}")
+
+    count = len(ps_index)
+    strike = chain.stored_column("strikePrice")
+    ps_perm = chain.strike_argsort(ps_index)
+    ps_strike = strike[ps_index[ps_perm]]
+    for (n, pb) in enumerate(pb_index):
+        start = np.searchsorted(ps_strike, strike[pb], side="right")
+        # positions into ps_index, back in generation order
+        pos = np.sort(ps_perm[start:])
+        legs = {"ps": ps_index[pos], "pb": np.full(len(pos), pb)}
+        order = n * count + pos
+        yield CandidateBlock(contracts, legs, order)
+
+def call_spread_pairs(contracts, cs_range, cb_range):
+    """
+    leg selection and pair generation, one block of cb legs for each cs leg
+    only the cb legs with a strike above the cs strike are paired
+    """
+    chain = contracts["call"]
+    cs_index = chain.delta_band(cs_range)
+    logging.info(f"cs_list count: {len(cs_index)}")
+    cb_index = chain.delta_band(cb_range)
+    logging.info(f"cb_list count: {len(cb_index)}")
+
+    count = len(cb_index)
+    strike = chain.stored_column("strikePrice")
+    cb_perm = chain.strike_argsort(cb_index)
+    cb_strike = strike[cb_index[cb_perm]]
+    for (n, cs) in enumerate(cs_index):
+        start = np.searchsorted(cb_strike, strike[cs], side="right")
+        # positions into cb_index, back in generation order
+        pos = np.sort(cb_perm[start:])
+        legs = {"cs": np.full(len(pos), cs), "cb": cb_index[pos]}
+        order = n * count + pos
+        yield CandidateBlock(contracts, legs, order)
+
+def ic_upper_bound(sort_key, call_part, call_width, put_part, underlying):
+    """
+    upper bound on the sort key of an IC whose call spread contributes call_part
+    (etc for et, tcc otherwise) and whose put spread contributes at most put_part
+      et    = etc + etp
+      tc    = tcc + tcp
+      tc_u  = 100 * tc / underlying
+      tc_w  = 100 * tc / width, and the IC width is never below the call width
+    """
+    if sort_key == "et" or sort_key == "tc":
+        return call_part + put_part
+    elif sort_key == "tc_u":
+        return 100 * ((call_part + put_part) / underlying)
+    elif sort_key == "tc_w":
+        return 100 * ((call_part + put_part) / call_width)
+    return None
+
+def ic_pairs(contracts, calls, puts, sink, shard=None):
+    """
+    pair generation for ICs, one block of put spreads for each call spread
+    calls and puts are the CandidateBlocks of the call and put spreads,
+    shard is an optional (start, stop) range of the call spreads to pair
+    every put spread is paired unless the symmetry check is on (IC_SYMMETRY or
+    --symmetry): then the put spreads are sorted by their ps delta, for each call
+    spread only the window of puts that can meet SELL_SYMMETRY is scanned, and
+    the pairs are checked with ic_symmetry_mask()
+    with a TopSink the call spreads are walked best first and the pairs whose
+    upper bound can not reach the current top are skipped
+    """
+    sort_key = ARGS["sort_key"]
+    symmetry = ARGS.get("symmetry", IC_SYMMETRY)
+    underlying = contracts["underlying"]
+    count = len(puts)
+    if shard is None:
+        shard = (0, len(calls))
+    call_order = range(*shard)
+
+    cs = calls.leg_arrays("cs")
+    cb = calls.leg_arrays("cb")
+    ps = puts.leg_arrays("ps")
+    pb = puts.leg_arrays("pb")
+    put_by_delta = np.argsort(ps[2], kind="stable")
+    put_delta = ps[2][put_by_delta]
+
+    call_part = None
+    put_part = None
+    if isinstance(sink, TopSink) and count and len(calls) and underlying > 0:
+        if sort_key == "et":
+            call_part = calls.props["etc"]
+            put_part = puts.props["etp"]
+        elif sort_key in ("tc", "tc_u", "tc_w"):
+            call_part = calls.props["tcc"]
+            put_part = puts.props["tcp"]
+    if put_part is not None:
+        # order the call spreads by the best IC they can be part of
+        call_width = calls.props["width"]
+        call_bounds = ic_upper_bound(sort_key, call_part, call_width, put_part.max(), underlying)
+        call_order = np.arange(*shard)
+        call_order = call_order[np.argsort(-call_bounds[call_order], kind="stable")].tolist()
+
+    for call_n in call_order:
+        threshold = sink.threshold()
+        if put_part is not None and threshold is not None:
+            if call_bounds[call_n] + TOP_BOUND_SLACK < threshold:
+                # remaining calls are bounded even lower
+                break
+
+        if symmetry:
+            # |csd + psd| < SELL_SYMMETRY, widened a little for rounding, the mask below is exact
+            csd = cs[2][call_n]
+            lo = np.searchsorted(put_delta, -SELL_SYMMETRY - csd - SYMMETRY_SLACK, side="left")
+            hi = np.searchsorted(put_delta, SELL_SYMMETRY - csd + SYMMETRY_SLACK, side="right")
+            index = np.sort(put_by_delta[lo:hi])
+            call_legs = [tuple(column[call_n] for column in leg) for leg in (cs, cb)]
+            put_legs = [tuple(column[index] for column in leg) for leg in (ps, pb)]
+            mask = ic_symmetry_mask(*call_legs, *put_legs)
+        else:
+            index = np.arange(count)
+            mask = np.ones(count, dtype=bool)
+        if put_part is not None and threshold is not None:
+            bounds = ic_upper_bound(sort_key, call_part[call_n], call_width[call_n], put_part[index], underlying)
+            mask &= ~(bounds + TOP_BOUND_SLACK < threshold)
+        index = index[mask]
+
+        legs = {}
+        legs["cs"] = np.full(len(index), calls.legs["cs"][call_n])
+        legs["cb"] = np.full(len(index), calls.legs["cb"][call_n])
+        legs["ps"] = puts.legs["ps"][index]
+        legs["pb"] = puts.legs["pb"][index]
+        terms = {}
+        for name in calls.terms:
+            terms["call_" + name] = np.full(len(index), calls.terms[name][call_n])
+        for name in puts.terms:
+            terms["put_" + name] = puts.terms[name][index]
+        order = call_n * count + index
+        yield CandidateBlock(contracts, legs, order, terms=terms)
+
+def prelimination_stage(blocks, stats):
+    for block in blocks:
+        stats["pairs"] += len(block)
+        mask = prelimination_mask(block)
+        stats["total"] += int(mask.sum())
+        yield block.select(mask)
+
+def metrics_stage(blocks, underlying):
+    for block in blocks:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if block.kind == "ic":
+                call = {}
+                put = {}
+                for name in block.terms:
+                    if name.startswith("call_"):
+                        call[name[5:]] = block.terms[name]
+                    else:
+                        put[name[4:]] = block.terms[name]
+                block.props = ic_props(call, put, underlying)
+            elif block.kind == "call":
+                cs = block.leg_arrays("cs")
+                cb = block.leg_arrays("cb")
+                block.props = call_spread_props(cs, cb, underlying)
+                block.terms = call_spread_terms(cs, cb, block.props)
+            else:
+                ps = block.leg_arrays("ps")
+                pb = block.leg_arrays("pb")
+                block.props = put_spread_props(ps, pb, underlying)
+                block.terms = put_spread_terms(ps, pb, block.props)
+        yield block
+
+def requirements_stage(blocks, stats):
+    names = {"ic": ("et", "tc"), "call": ("etc", "tcc"), "put": ("etp", "tcp")}
+    for block in blocks:
+        (et_name, tc_name) = names[block.kind]
+        mask = requirements_mask(block.props, et_name, tc_name)
+        count = int(mask.sum())
+        stats["meet"] += count
+        if count:
+            yield block.select(mask)
+
+def run_pipeline(contracts, pairs, sink):
+    stats = {"pairs": 0, "total": 0, "meet": 0}
+    blocks = prelimination_stage(pairs, stats)
+    blocks = metrics_stage(blocks, contracts["underlying"])
+    blocks = requirements_stage(blocks, stats)
+    for block in blocks:
+        sink.add(block)
+    return stats
+
+#
+# parallel IC evaluation (--workers):
+#   the chain columns and the spread blocks are packed into one shared memory segment
+#   that the workers map, the call spreads are cut into shards of IC_SHARD_CALLS and
+#   every shard runs through the pipeline into a sink of its own in a worker
+#   the shards are merged back in call order
+#
+def pack_shared(arrays):
+    """
+    copy a dict of numpy arrays into one shared memory segment
+    returns the segment and the spec unpack_shared() needs to map the arrays
+    """
+    layout = {}
+    size = 0
+    for name in arrays:
+        array = arrays[name]
+        layout[name] = (size, array.dtype.str, array.shape)
+        size += (array.nbytes + 7) // 8 * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 8))
+    for name in arrays:
+        (offset, dtype, shape) = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = arrays[name]
+    return (shm, (shm.name, layout))
+
+def unpack_shared(spec):
+    (name, layout) = spec
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for key in layout:
+        (offset, dtype, shape) = layout[key]
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+    return (shm, arrays)
+
+def shared_block_arrays(name, block, arrays):
+    for leg in block.legs:
+        arrays[f"{name}.legs.{leg}"] = block.legs[leg]
+    arrays[f"{name}.order"] = block.order
+    for propname in block.props:
+        arrays[f"{name}.props.{propname}"] = block.props[propname]
+    for term in block.terms:
+        arrays[f"{name}.terms.{term}"] = block.terms[term]
+
+def shared_block(contracts, name, arrays):
+    parts = {"legs": {}, "props": {}, "terms": {}}
+    for key in arrays:
+        fields = key.split(".")
+        if fields[0] == name and len(fields) == 3:
+            parts[fields[1]][fields[2]] = arrays[key]
+    return CandidateBlock(contracts, parts["legs"], arrays[f"{name}.order"], parts["props"], parts["terms"])
+
+# per worker state, set by ic_worker_init
+IC_WORKER = {}
+
+def ic_worker_init(spec, underlying, sort_key, symmetry, top, scales):
+    (shm, arrays) = unpack_shared(spec)
+    contracts = {"underlying": underlying}
+    for option_type in ("call", "put"):
+        columns = {}
+        for propname in ("strikePrice", "mark", "delta"):
+            columns[propname] = arrays[f"{option_type}.{propname}"]
+        contracts[option_type] = OptionChain(columns, scales)
+    ARGS["sort_key"] = sort_key
+    ARGS["symmetry"] = symmetry
+    IC_WORKER["shm"] = shm
+    IC_WORKER["contracts"] = contracts
+    IC_WORKER["calls"] = shared_block(contracts, "calls", arrays)
+    IC_WORKER["puts"] = shared_block(contracts, "puts", arrays)
+    IC_WORKER["top"] = top
+
+def ic_worker_shard(shard):
+    # run one shard of call spreads, returns the stats and the columns of the kept candidates
+    contracts = IC_WORKER["contracts"]
+    if IC_WORKER["top"]:
+        sink = TopSink(ARGS["sort_key"], IC_WORKER["top"])
+    else:
+        sink = ListSink()
+    pairs = ic_pairs(contracts, IC_WORKER["calls"], IC_WORKER["puts"], sink, shard)
+    stats = run_pipeline(contracts, pairs, sink)
+    block = concat_blocks(contracts, ("cs", "cb", "ps", "pb"), sink.blocks())
+    return (stats, block.legs, block.order, block.props)
+
+def run_ic_workers(contracts, calls, puts, sink, workers):
+    """
+    parallel version of run_pipeline(contracts, ic_pairs(...), sink)
+    the worker count only changes the speed, not the candidates or stats
+    """
+    arrays = {}
+    for option_type in ("call", "put"):
+        chain = contracts[option_type]
+        for propname in ("strikePrice", "mark", "delta"):
+            arrays[f"{option_type}.{propname}"] = chain.stored_column(propname)
+    shared_block_arrays("calls", calls, arrays)
+    shared_block_arrays("puts", puts, arrays)
+
+    top = None
+    if isinstance(sink, TopSink):
+        top = ARGS["top"]
+    shards = []
+    for start in range(0, len(calls), IC_SHARD_CALLS):
+        shards.append((start, min(start + IC_SHARD_CALLS, len(calls))))
+
+    stats = {"pairs": 0, "total": 0, "meet": 0}
+    (shm, spec) = pack_shared(arrays)
+    try:
+        # fork: the workers must not run the main code of this script again
+        context = multiprocessing.get_context("fork")
+        initargs = (spec, contracts["underlying"], ARGS["sort_key"], ARGS.get("symmetry", IC_SYMMETRY), top, contracts["call"].scales)
+        with context.Pool(workers, ic_worker_init, initargs) as pool:
+            for (shard_stats, legs, order, props) in pool.imap(ic_worker_shard, shards):
+                for key in stats:
+                    stats[key] += shard_stats[key]
+                if len(order):
+                    sink.add(CandidateBlock(contracts, legs, order, props))
+    finally:
+        shm.close()
+        shm.unlink()
+    return stats
+
+def union_range(*delta_ranges):
+    # smallest delta range covering all of delta_ranges
+    return (min(r[0] for r in delta_ranges), max(r[1] for r in delta_ranges))
+
+def covers(outer, inner):
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
+
+class SharedSpreads:
+    """
+    put and call spreads of one chain for several scan modes (run_scan() with more
+    than one mode): the pairs of the union of the IC and the PSR_*/CSR_* delta bands
+    go through prelimination and metrics once, each mode takes the subset within its
+    own bands, in the order its own pair generation would have made them
+    """
+    BANDS = {
+        "put": (union_range(IC_PS_DELTA_RANGE, PSR_PS_DELTA_RANGE), union_range(IC_PB_DELTA_RANGE, PSR_PB_DELTA_RANGE)),
+        "call": (union_range(IC_CS_DELTA_RANGE, CSR_CS_DELTA_RANGE), union_range(IC_CB_DELTA_RANGE, CSR_CB_DELTA_RANGE)),
+    }
+    LEGS = {"put": ("ps", "pb"), "call": ("cs", "cb")}
+
+    def __init__(self, contracts):
+        self._contracts = contracts
+        self._blocks = {}
+
+    def _spreads(self, kind):
+        # every spread of the union bands that passes prelimination, with its metrics
+        if kind not in self._blocks:
+            if kind == "put":
+                pairs = put_spread_pairs(self._contracts, *self.BANDS[kind])
+            else:
+                pairs = call_spread_pairs(self._contracts, *self.BANDS[kind])
+            stats = {"pairs": 0, "total": 0, "meet": 0}
+            blocks = metrics_stage(prelimination_stage(pairs, stats), self._contracts["underlying"])
+            self._blocks[kind] = concat_blocks(self._contracts, self.LEGS[kind], list(blocks))
+            logging.info(f"shared {kind} spreads: {len(self._blocks[kind])} of {stats['pairs']} pairs")
+        return self._blocks[kind]
+
+    def select(self, kind, delta_ranges):
+        """
+        the spreads of kind with the legs within delta_ranges ((ps, pb) or (cs, cb)),
+        None when the ranges are not covered by the shared bands
+        """
+        if not all(covers(band, r) for (band, r) in zip(self.BANDS[kind], delta_ranges)):
+            return None
+        block = self._spreads(kind)
+        chain = self._contracts[kind]
+        mask = np.ones(len(block), dtype=bool)
+        for (leg, delta_range) in zip(self.LEGS[kind], delta_ranges):
+            mask &= np.isin(block.legs[leg], chain.delta_band(delta_range))
+        return block.select(mask)
+
+def run_shared_pipeline(block, sink):
+    # run_pipeline() for spreads from SharedSpreads, past prelimination and metrics already
+    stats = {"pairs": len(block), "total": len(block), "meet": 0}
+    if not len(block):
+        return stats
+    for block in requirements_stage([block], stats):
+        sink.add(block)
+    return stats
+
+def get_put_spreads(contracts, ps_range, pb_range, sink, spreads=None):
+    block = None
+    if spreads is not None:
+        block = spreads.select("put", (ps_range, pb_range))
+    if block is not None:
+        stats = run_shared_pipeline(block, sink)
+    else:
+        stats = run_pipeline(contracts, put_spread_pairs(contracts, ps_range, pb_range), sink)
+    print ("----------------------")
+    print("total put candidates:", stats["total"])
+    print("meet req candidates:", stats["meet"])                    
+
+def get_call_spreads(contracts, cs_range, cb_range, sink, spreads=None):
+    block = None
+    if spreads is not None:
+        block = spreads.select("call", (cs_range, cb_range))
+    if block is not None:
+        stats = run_shared_pipeline(block, sink)
+    else:
+        stats = run_pipeline(contracts, call_spread_pairs(contracts, cs_range, cb_range), sink)
+    print ("----------------------")
+    print("total call candidates:", stats["total"])
+    print("meet req candidates:", stats["meet"])    
 
-def get_candidates_put(contracts, ps_range=None, pb_range=None):
+def get_candidates_put(contracts, ps_range=None, pb_range=None, sink=None, spreads=None):
     # set default sort key
     if "sort_key" not in ARGS:
         ARGS["sort_key"] = "etp"
-    candidates = []
-    put_list = contracts["put"]
     if ps_range is None:
         ps_range = PSR_PS_DELTA_RANGE
     if pb_range is None:
         pb_range = PSR_PB_DELTA_RANGE
+    if sink is None:
+        sink = ListSink()
 
-    pb_list = []
-    for pb in put_list:
-        logging.info(f"--------pb: strike:{pb.strike}, delta:{pb.delta}, price:{pb.price}")
-       
-        if pb.delta < pb_range[0] or pb.delta > pb_range[1]:
-            logging.info(f"BAD delta range: put buy delta: {pb.delta}")
-        else:
-            pb_list.append(pb)
-
-    logging.info(f"pb_list count: {len(pb_list)}")
-    ps_list = []
-    for ps in put_list:
-        logging.info(f"------ps: strike:{ps.strike}, delta:{ps.delta}, price:{ps.price}")
-            
-        if ps.delta < ps_range[0] or ps.delta > ps_range[1]:
-            logging.info(f"BAD delta range: put sell delta: {ps.delta}")
-        else:
-            ps_list.append(ps)
-    logging.info(f"ps_list count: {len(ps_list)}")
+    get_put_spreads(contracts, ps_range, pb_range, sink, spreads)
+    return sink.result()
 
-    #for option in put_list:
-        #print(f"put_list.strike: {option.strike:.3f}")
-     
-    underlying = contracts["underlying"]
-    volatility = contracts["volatility"]
-    interestRate = contracts["interestRate"]
-    expireDate = contracts["expireDate"]
-    total_count = 0
-    meet_requirements_count = 0
-    
-    for pb in pb_list:
-        logging.info(f"--------pb: strike:{pb.strike}, delta:{pb.delta}, price:{pb.price}")
-        for ps in ps_list:
-            if pb.strike >= ps.strike:
-                logging.debug(f"skip pb.strike > ps.strike  {pb.strike}>{ps.strike}")
-                continue
-            logging.debug(f"------ps: strike:{ps.strike}, delta:{ps.delta}, price:{ps.price}")            
-            
-            if prelimination(ps=ps, pb=pb):
-                total_count += 1
-                candidate = Candidate(ps=ps, pb=pb, underlying=underlying, volatility=volatility, interestRate=interestRate, expireDate=expireDate)
-                       
-                if candidate.meets_requirements():
-                    candidates.append(candidate)
-                    meet_requirements_count += 1        
 
-    print ("----------------------")
-    print("total put candidates:", total_count)
-    print("meet req candidates:", meet_requirements_count)                    
-    return candidates
-
-
-def get_candidates_call(contracts, cs_range=None, cb_range=None):
+def get_candidates_call(contracts, cs_range=None, cb_range=None, sink=None, spreads=None):
     # set default sort key
     if "sort_key" not in ARGS:
         ARGS["sort_key"] = "etc"
-    candidates = []
-    call_list = contracts["call"]
     if cs_range is None:
         cs_range = CSR_CS_DELTA_RANGE
     if cb_range is None:
         cb_range = CSR_CB_DELTA_RANGE
+    if sink is None:
+        sink = ListSink()
 
-    cs_list = []
-    for cs in call_list:
-        logging.info(f"check--------cs: strike:{cs.strike}, delta:{cs.delta}, price:{cs.price}")
-       
-        if  cs.delta < cs_range[0] or cs.delta > cs_range[1]:
-            logging.info(f"BAD delta range: call sell delta: {cs.delta}")
-        else:
-            cs_list.append(cs)
-    logging.info(f"cs_list count: {len(cs_list)}")
-
-    cb_list = []
-    for cb in call_list:
-        logging.info(f"check------cb: strike:{cb.strike}, delta:{cb.delta}, price:{cb.price}")
-            
-        if cb.delta < cb_range[0] or cb.delta > cb_range[1]:
-            logging.info(f"BAD delta range: call but delta: {cb.delta}")
-        else:
-            cb_list.append(cb)
-    logging.info(f"cb_list count: {len(cb_list)}")
+    get_call_spreads(contracts, cs_range, cb_range, sink, spreads)
+    return sink.result()
 
-     
-    underlying = contracts["underlying"]
-    volatility = contracts["volatility"]
-    interestRate = contracts["interestRate"]
-    expireDate = contracts["expireDate"]
-    total_count = 0
-    meet_requirements_count = 0
-    
-    for cs in cs_list:
-        logging.info(f"--------cs: strike:{cs.strike}, delta:{cs.delta}, price:{cs.price}")
-    
-        for cb in cb_list:
-            if cb.strike <= cs.strike:
-                logging.info(f"skip cb.strike <= cs.strike: {cb.strike} <= {cs.strike}")
-                continue
-            logging.info(f"------cb: {cb.desc} strike:{cb.strike}, delta:{cb.delta}, price:{cb.price}")
-               
-            if prelimination(cs=cs, cb=cb):
-                total_count += 1
-                candidate = Candidate(cs=cs, cb=cb, underlying=underlying, volatility=volatility, interestRate=interestRate, expireDate=expireDate)
-                       
-                if candidate.meets_requirements():
-                    candidates.append(candidate)
-                    meet_requirements_count += 1
-
-    print ("----------------------")
-    print("total call candidates:", total_count)
-    print("meet req candidates:", meet_requirements_count)    
-
-    return candidates
-
-def get_ic_candidates(contracts):
+def get_ic_candidates(contracts, sink=None, spreads=None):
     if "sort_key" not in ARGS:
         ARGS["sort_key"] = "et"
+    if sink is None:
+        sink = ListSink()
 
-    ic_candidates = []
-    underlying = contracts["underlying"]
-    volatility = contracts["volatility"]
-    interestRate = contracts["interestRate"]
-    expireDate = contracts["expireDate"]
+    put_sink = ListSink()
+    get_put_spreads(contracts, IC_PS_DELTA_RANGE, IC_PB_DELTA_RANGE, put_sink, spreads)
+    puts = concat_blocks(contracts, ("ps", "pb"), put_sink.blocks())
+    call_sink = ListSink()
+    get_call_spreads(contracts, IC_CS_DELTA_RANGE, IC_CB_DELTA_RANGE, call_sink, spreads)
+    calls = concat_blocks(contracts, ("cs", "cb"), call_sink.blocks())
+
+    logging.info(f"get_ic_candidates put_list (count: {len(puts)}), call_list (count: {len(calls)})")
+
+    if "workers" in ARGS:
+        stats = run_ic_workers(contracts, calls, puts, sink, ARGS["workers"])
+    else:
+        stats = run_pipeline(contracts, ic_pairs(contracts, calls, puts, sink), sink)
+    total_count = len(calls) * len(puts)
 
-    put_list = get_candidates_put(contracts, ps_range=IC_PS_DELTA_RANGE, pb_range=IC_PB_DELTA_RANGE)
-    call_list = get_candidates_call(contracts, cs_range=IC_CS_DELTA_RANGE, cb_range=IC_CB_DELTA_RANGE)
- 
-       
-    logging.info(f"get_ic_candidates put_list (count: {len(put_list)}):")
-    for put in put_list:
-        logging.info(put)
-    logging.info(f"get_ic_candidates call_list (count: {len(call_list)}):")
-    for call in call_list:
-        logging.info(call)
-
-    total_count = 0
-    meet_requirements_count = 0
-    
-    for call in call_list:
-        logging.info(f"--------ic calls: {call}")
-    
-        for put in put_list:
-            logging.info(f"----------ic puts {put}")
-            total_count += 1
-            candidate = Candidate(cs=call.cs, cb=call.cb, ps=put.ps, pb=put.pb, underlying=underlying, volatility=volatility, interestRate=interestRate, expireDate=expireDate)
-                       
-            if candidate.meets_requirements(): # and check_preq(candidate):
-                ic_candidates.append(candidate)
-                meet_requirements_count += 1   
-
-            
     print ("----------------------")
     print("total ic candidates:", total_count)
-    print("meet req ic candidates:", meet_requirements_count)                    
+    if stats["pairs"] != total_count:
+        print("evaluated ic candidates:", stats["pairs"])
+    print("meet req ic candidates:", stats["meet"])                    
+
+    return sink.result()
+
+def make_sink(kind):
+    if "csv" in ARGS:
+        return CsvSink(ARGS["csv"])
+    elif ARGS["count_only"]:
+        return CountSink()
+    elif "top" in ARGS and ARGS["sort_key"] in KIND_PROPS[kind]:
+        return TopSink(ARGS["sort_key"], ARGS["top"])
+    else:
+        # a sort key the kind does not have is reported when the candidates are sorted
+        return ListSink()
+
+def expiration_window():
+    # (dt_min, dt_max) midnights of the expirations to fetch, 41 to 60 days out
+    seconds_in_day = 24.0 * 60.0 * 60.0
+    exp_target_min = time.time() + 41.0 * seconds_in_day
+    exp_target_max = time.time() + 60.0 * seconds_in_day
+    dt = datetime.fromtimestamp(exp_target_min)
+    # get time as of midnight
+    dt_min = datetime(year=dt.year, month=dt.month, day=dt.day)
+    dt = datetime.fromtimestamp(exp_target_max)
+    dt_max = datetime(year=dt.year, month=dt.month, day=dt.day)
+    return (dt_min, dt_max)
+
+def refresh_chains(symbols):
+    """
+    fetch the chains of symbols concurrently and save them, the --dataonly
+    refresh of a stock list
+    returns the symbols that were saved
+    """
+    (dt_min, dt_max) = expiration_window()
+    saved = []
+    for (symbol, chains) in chain_fetcher().fetch_all(symbols, dt_min, dt_max):
+        if not chains:
+            print(f"could not get any options for {symbol}")
+            continue
+        try:
+            contracts = get_contracts(symbol, chains)
+        except SystemExit:
+            # get_options() gives up on bad data with sys.exit
+            contracts = None
+        except Exception:
+            logging.exception(f"{symbol}: could not save the chain")
+            contracts = None
+        if contracts:
+            saved.append(symbol)
+        else:
+            print(f"could not save options for {symbol}")
+    return saved
+
+def load_contracts(symbol, reload=False, replay=False, at=None):
+    """
+    option chain of symbol for a scan: the stored response with replay, the snapshot
+    log entry nearest to the at timestamp, the most recent data file, or else a new
+    fetch that is saved
+    returns None when no chain could be loaded
+    """
+    data_filename = ""
+    if not reload and not replay and at is None:
+        data_filename = get_data_filename(symbol)
+
+    dt_now = datetime.fromtimestamp(time.time())
+    print(f"run date: {dt_now.year}-{dt_now.month:02}-{dt_now.day:02}  datafile: {data_filename}")
+    (dt_min, dt_max) = expiration_window()
+
+    if replay:
+        # stored raw response, at picks the one fetched nearest to that time
+        # the snapshot files are not written again
+        chains = load_raw_response(symbol, at)
+        if not chains:
+            print(f"no stored responses for {symbol}")
+            return None
+        return get_contracts(symbol, chains, save=False)
+    if at is not None:
+        # intraday snapshot from the log, never fetch
+        contracts = load_snapshot_log(symbol, at)
+        if not contracts:
+            print(f"no snapshot log for {symbol}")
+            return None
+        return contracts
+
+    contracts = None
+    if not reload and data_filename:
+        # see if we can load from previous file
+        contracts = load_from_file(symbol, data_filename)
+    if not contracts:
+        chains = get_chains(symbol, dt_min, dt_max)
+        if not chains:
+            print("could not get any options")
+            return None
+        contracts = get_contracts(symbol, chains)
+    return contracts
+
+def scan_mode(symbol, contracts, kind, spreads=None):
+    """
+    search and print the candidates of one kind ("IC", "put" or "call") with the options in ARGS
+    spreads: SharedSpreads of contracts when other modes run on the same chain
+    returns the result record of the run
+    """
+    # contracts: {"underlying": underlying, "call": calls, "put": puts}
+    if kind == "call":
+        option_types = ("call",)
+    elif kind == "put":
+        option_types = ("put",)
+    else:
+        option_types = ("call", "put")
 
-    return ic_candidates
+    for k in option_types:
+        options = contracts[k]
+        print(k, len(options))
+        for option in options:
+            print(option.desc, option.delta)
 
- 
-def print_usage():
-    print("usage: python get_options.py [--skip-delta] [--sort prop] [--calls|--puts] [--reload|--useold|--dataonly] SYM")
+    for k in option_types:
+        options = contracts[k]
+        if len(options) == 0:
+            print("no candidates!")
+            return result_record(symbol, kind, contracts, [], 0)
+
+    if "sort_key" not in ARGS:
+        ARGS["sort_key"] = RECORD_BEST_KEYS[kind]
+    sink = make_sink(kind)
+
+    try:
+        if kind == "put":
+            candidates = get_candidates_put(contracts, sink=sink, spreads=spreads)
+        elif kind == "call":
+            candidates = get_candidates_call(contracts, sink=sink, spreads=spreads)
+        else:
+            candidates = get_ic_candidates(contracts, sink=sink, spreads=spreads)
+    finally:
+        # the csv file is closed by result(), also close it when the search raised
+        if isinstance(sink, CsvSink):
+            sink.close()
+    if not isinstance(sink, (ListSink, TopSink)):
+        print("got", sink.count, kind, "candidates")
+        return result_record(symbol, kind, contracts, [], sink.count)
+    print("got", len(candidates), kind, "candidates")
+     
 
+    print("======================")
 
-#
-# Main
-#
-if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
-    print_usage()
-    sys.exit(1)
-
-symbols = []
-reload = False
-useold = False
-dataonly = False
-ARGS["skip_delta"] = False
-ARGS["option_type"] = "ALL"  # or CALLS_ONLY or PUTS_ONLY
-
-# setup logging
-root = logging.getLogger()
-root.setLevel(logging.DEBUG)
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(loglevel)
-formatter = logging.Formatter('%(levelname)s: %(message)s')
-handler.setFormatter(formatter)
-#logging.basicConfig(format='LOG %(message)s', level=loglevel)
-root.addHandler(handler)
-
-sort_key_arg = False
-for argn in range(1, len(sys.argv)):
-    argval = sys.argv[argn]
-    if sort_key_arg:
-        ARGS["sort_key"] = argval
-        sort_key_arg = False
-    elif argval.startswith('-'):
-        if argval == "--skip-delta":
-            ARGS["skip_delta"] = True
-        elif argval == "--reload":
-            reload = True
-        elif argval == "--useold":
-            useold = True    
-        elif argval == "--dataonly":
-            dataonly = True
-        elif argval == "--calls":
-            ARGS["option_type"] = "CALLS_ONLY"
-        elif argval == "--puts":
-            ARGS["option_type"] = "PUTS_ONLY"
-        elif argval == "--sort":
-            sort_key_arg = True       
+    sort_key = ARGS["sort_key"]
+    if candidates:
+        # all candidates come from the one block the sink built
+        block = candidates[0].block
+        logging.info(f"properties: {list(block.props.keys())}")
+        block.rank()
+        if sort_key in block.props:
+            candidates = block.sorted_candidates(sort_key)
         else:
-            print_usage()
-            sys.exit(1)
+            logging.error(f"unexpected sort key: {sort_key}")
+
+
+    if len(candidates) == 0:
+        print("no candidates!")
     else:
-        symbols.append(argval)
-if not symbols:
-    print_usage()
-    sys.exit(1)
-if dataonly:
-    reload = True
-if reload and useold:
-    print_usage()
-    sys.exit(1)
-symbol = symbols[0]
-print("getting symbol:", symbol)
-
-seconds_in_day = 24.0 * 60.0 * 60.0
-exp_target_min = time.time() + 41.0 * seconds_in_day
-exp_target_max = time.time() + 60.0 * seconds_in_day
-
-data_filename = ""
-if not reload:
-    data_filename = get_data_filename(symbol)
-
-
-dt_now = datetime.fromtimestamp(time.time())
-print(f"run date: {dt_now.year}-{dt_now.month:02}-{dt_now.day:02}  datafile: {data_filename}")
-dt = datetime.fromtimestamp(exp_target_min)
-# get time as of midnight
-dt_min = datetime(year=dt.year, month=dt.month, day=dt.day)
-dt = datetime.fromtimestamp(exp_target_max)
-dt_max = datetime(year=dt.year, month=dt.month, day=dt.day)
-    
-contracts = None
-if not reload and data_filename:
-    # see if we can load from previous file
-    contracts = load_from_file(data_filename)
-
-if not contracts:
-    chains = get_chains(symbol, dt_min, dt_max)
-    if not chains:
-        print("could not get any options")
-        sys.exit(1)
-    contracts = get_contracts(symbol, chains)
+        print("======================")
+        first_candidate = candidates[0]
+        underlying = first_candidate.underlying
+        expireDate = first_candidate.expireDate
+      
+        daysToExpiration = getDayCount(expireDate) 
+        print(f"{symbol}: underlying: {underlying} sorting by: [{sort_key}]")
+        print(f"{symbol}: daysToExpiration: {daysToExpiration}")
 
-    if dataonly:
-        print("done!")
-        sys.exit(0)
+    printCandidates(candidates)
+    return result_record(symbol, kind, contracts, candidates, sink.count)
 
+class ThreadOutput(io.TextIOBase):
+    """
+    stand-in for sys.stdout when several threads print at once: output_to() sets the
+    stream of the calling thread only, the others keep writing to the default
+    """
 
-# contracts: {"underlying": underlying, "call": calls, "put": puts}
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
 
-if ARGS["option_type"] == "CALLS_ONLY":
-    option_types = ("call",)
-elif ARGS["option_type"] == "PUTS_ONLY":
-    option_types = ("put",)
-else:
-    option_types = ("call", "put")
+    def stream(self):
+        return getattr(self._local, "stream", self._default)
 
-for k in option_types:
-    options = contracts[k]
-    print(k, len(options))
-    for option in options:
-        print(option.desc, option.delta)
+    def writable(self):
+        return True
 
-for k in option_types:
-    options = contracts[k]
-    if len(options) == 0:
-        print("no candidates!")
-        sys.exit(0)
+    def write(self, text):
+        return self.stream().write(text)
+
+    def flush(self):
+        self.stream().flush()
+
+@contextlib.contextmanager
+def output_to(stream):
+    # redirect_stdout, per thread when sys.stdout is a ThreadOutput
+    output = sys.stdout
+    if not isinstance(output, ThreadOutput):
+        with contextlib.redirect_stdout(stream):
+            yield stream
+        return
+    previous = getattr(output._local, "stream", None)
+    output._local.stream = stream
+    try:
+        yield stream
+    finally:
+        if previous is None:
+            del output._local.stream
+        else:
+            output._local.stream = previous
+
+def mode_filename(filename, mode):
+    # out.csv -> out_IC.csv, out_put.csv, out_call.csv
+    (root, ext) = os.path.splitext(filename)
+    return f"{root}_{mode}{ext}"
+
+def scan_settings(options):
+    # ARGS of a scan: the defaults the command line sets, then options
+    settings = {"skip_delta": False, "count_only": False}
+    settings.update(options)
+    return settings
+
+def set_args(settings):
+    # keys are replaced one by one, a loader thread may read ARGS meanwhile
+    for key in list(ARGS):
+        if key not in settings:
+            del ARGS[key]
+    ARGS.update(settings)
+
+def load_scan(symbol, reload=False, replay=False, at=None):
+    """
+    first half of scan(): load the option chain of symbol with the messages printed
+    on the way captured, safe to run in a thread next to run_scan()
+    returns (contracts, messages), contracts is None when no chain could be loaded
+    """
+    preamble = io.StringIO()
+    with output_to(preamble):
+        print("getting symbol:", symbol)
+        contracts = load_contracts(symbol, reload, replay, at)
+    return (contracts, preamble.getvalue())
+
+def run_scan(symbol, contracts, preamble, modes=SCAN_MODES, outputs=None, **options):
+    """
+    second half of scan(): run each of modes on the loaded contracts, preamble is
+    written at the start of each output; with several modes the spreads are built
+    once for all of them (SharedSpreads) and each mode gets a csv file of its own
+    returns {mode: result record}
+    """
+    settings = scan_settings(options)
+    spreads = None
+    if len(modes) > 1:
+        spreads = SharedSpreads(contracts)
+    records = {}
+    for mode in modes:
+        # every mode starts from the same options, the sort key default depends on the mode
+        set_args(settings)
+        if "csv" in settings and len(modes) > 1:
+            ARGS["csv"] = mode_filename(settings["csv"], mode)
+        output = sys.stdout
+        if outputs is not None:
+            output = outputs[mode]
+            output.write(preamble)
+        with output_to(output):
+            records[mode] = scan_mode(symbol, contracts, mode, spreads)
+        if "record" in ARGS:
+            save_record(ARGS["record"], records[mode])
+    return records
+
+def scan(symbol, modes=SCAN_MODES, reload=False, replay=False, at=None, outputs=None, **options):
+    """
+    load the option chain of symbol once and run each of modes on it, the library
+    version of the command line
+      options: ARGS settings like sort_key, top, count_only, csv, workers, fixed_point, record
+      outputs: mode -> file the text of that mode goes to, the load messages are
+               repeated at the start of each, default everything goes to stdout
+    with no modes the chain is only loaded (--dataonly with reload)
+    returns {mode: result record}, or None when no chain could be loaded
+    """
+    set_args(scan_settings(options))
+    (contracts, preamble) = load_scan(symbol, reload, replay, at)
+    if contracts and not modes:
+        preamble += "done!\n"
+    if not contracts or not modes or outputs is None:
+        sys.stdout.write(preamble)
+    if not contracts:
+        return None
+    return run_scan(symbol, contracts, preamble, modes, outputs, **options)
+
+def setup_logging():
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(loglevel)
+    formatter = logging.Formatter('%(levelname)s: %(message)s')
+    handler.setFormatter(formatter)
+    #logging.basicConfig(format='LOG %(message)s', level=loglevel)
+    root.addHandler(handler)
 
-if "call" not in option_types:
-    candidates = get_candidates_put(contracts)
-    print("got", len(candidates), "put candidates")
-elif "put" not in option_types:
-    candidates = get_candidates_call(contracts)
-    print("got", len(candidates), "call candidates")
-else:
-    candidates = get_ic_candidates(contracts)
-    print("got", len(candidates), "IC candidates")
  
+def print_usage():
+    print("usage: python get_options.py [--skip-delta] [--fixed-point] [--sort prop] [--symmetry] [--top N|--count|--csv file] [--workers N] [--record file] [--calls|--puts|--all] [--reload|--useold|--dataonly|--at TIME|--archive|--compact|--query spec] [--replay] SYM")
 
-print("======================")
 
-propnames = set()
-for candidate in candidates:
-    for propname in candidate.get_props():
-        propnames.add(propname)
+#
+# Main
+#
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print_usage()
+        sys.exit(1)
 
-logging.info(f"properties: {propnames}")
+    symbols = []
+    modes = ("IC",)
+    reload = False
+    useold = False
+    dataonly = False
+    archive = False
+    compact = False
+    query = None
+    replay = False
+
+    setup_logging()
+
+    sort_key_arg = False
+    top_arg = False
+    csv_arg = False
+    workers_arg = False
+    at_arg = False
+    query_arg = False
+    record_arg = False
+    for argn in range(1, len(sys.argv)):
+        argval = sys.argv[argn]
+        if sort_key_arg:
+            ARGS["sort_key"] = argval
+            sort_key_arg = False
+        elif top_arg:
+            if not argval.isdigit() or int(argval) < 1:
+                print_usage()
+                sys.exit(1)
+            ARGS["top"] = int(argval)
+            top_arg = False
+        elif csv_arg:
+            ARGS["csv"] = argval
+            csv_arg = False
+        elif workers_arg:
+            if not argval.isdigit() or int(argval) < 1:
+                print_usage()
+                sys.exit(1)
+            ARGS["workers"] = int(argval)
+            workers_arg = False
+        elif at_arg:
+            try:
+                ARGS["at"] = datetime.fromisoformat(argval).timestamp()
+            except ValueError:
+                print_usage()
+                sys.exit(1)
+            at_arg = False
+        elif query_arg:
+            query = argval
+            query_arg = False
+        elif record_arg:
+            ARGS["record"] = argval
+            record_arg = False
+        elif argval.startswith('-'):
+            if argval == "--skip-delta":
+                ARGS["skip_delta"] = True
+            elif argval == "--fixed-point":
+                ARGS["fixed_point"] = True
+            elif argval == "--symmetry":
+                ARGS["symmetry"] = True
+            elif argval == "--reload":
+                reload = True
+            elif argval == "--useold":
+                useold = True    
+            elif argval == "--dataonly":
+                dataonly = True
+            elif argval == "--archive":
+                archive = True
+            elif argval == "--compact":
+                compact = True
+            elif argval == "--replay":
+                replay = True
+            elif argval == "--query":
+                query_arg = True
+            elif argval == "--calls":
+                modes = ("call",)
+            elif argval == "--puts":
+                modes = ("put",)
+            elif argval == "--all":
+                modes = SCAN_MODES
+            elif argval == "--sort":
+                sort_key_arg = True       
+            elif argval == "--top":
+                top_arg = True
+            elif argval == "--count":
+                ARGS["count_only"] = True
+            elif argval == "--csv":
+                csv_arg = True
+            elif argval == "--workers":
+                workers_arg = True
+            elif argval == "--at":
+                at_arg = True
+            elif argval == "--record":
+                record_arg = True
+            else:
+                print_usage()
+                sys.exit(1)
+        else:
+            symbols.append(argval)
+    if not symbols or sort_key_arg or top_arg or csv_arg or workers_arg or at_arg or query_arg or record_arg:
+        print_usage()
+        sys.exit(1)
+    if dataonly:
+        reload = True
+        modes = ()
+    if (reload or useold) and "at" in ARGS:
+        print_usage()
+        sys.exit(1)
+    if replay and (reload or useold):
+        print_usage()
+        sys.exit(1)
+    if reload and useold:
+        print_usage()
+        sys.exit(1)
+    symbol = symbols[0]
 
-for propname in propnames:
-    can_sort = True
-    for candidate in candidates:
-        if not candidate.has_prop(propname):
-            can_sort = False
-            break
-    if not can_sort:
-        continue
-    if propname in NON_REVERSE_SORT:
-        reverse = False
-    else:
-        reverse = True
-    candidates.sort(key = lambda candidate: candidate.get_prop(propname), reverse=reverse)
-    rank = 1
-    order = 1
-    prev = None
-    for candidate in candidates:
-        candidate.set_order(propname, order)
-        val = candidate.get_prop(propname)
-        if prev:
-            if abs(val - prev) > 0.001:
-                rank = order
-        candidate.set_rank(propname, rank)
-        order += 1
-        prev = val
-
-
-if len(candidates) == 0:
-    print("no candidates!")
-else:
-    print("======================")
-    sort_key = ARGS["sort_key"]
-    first_candidate = candidates[0]
-    #print("first_candidate:", first_candidate)
-    #print("underlying:", first_candidate.underlying)
-    #print("volatility:", first_candidate.volatility)
-    underlying = first_candidate.underlying
-    volatility = first_candidate.volatility
-    interestRate = first_candidate.interestRate
-    expireDate = first_candidate.expireDate
-  
-    daysToExpiration = getDayCount(expireDate) 
-    print(f"{symbol}: underlying: {underlying} sorting by: [{sort_key}]")
-    #print(f"{symbol}: volatility: {volatility}")
-    #print(f"{symbol}: interestRate: {interestRate}")
-    #print(f"{symbol}: expireDate: {expireDate}")
-    print(f"{symbol}: daysToExpiration: {daysToExpiration}")
-candidates.sort(key = lambda candidate: candidate.get_order(sort_key))
-
-printCandidates(candidates)
- 
\ No newline at end of file
+    if archive or compact or query is not None:
+        print("getting symbol:", symbol)
+    if archive:
+        archive_snapshots(symbol)
+        sys.exit(0)
+    if compact:
+        compact_history(symbol)
+        sys.exit(0)
+    if query is not None:
+        try:
+            print_history_query(symbol, query)
+        except ValueError as e:
+            print(e)
+            print(print_history_query.__doc__)
+            sys.exit(1)
+        sys.exit(0)
+
+    options = dict(ARGS)
+    at = options.pop("at", None)
+    if scan(symbol, modes, reload=reload, replay=replay, at=at, **options) is None:
+        sys.exit(1)
@@ -0,0 +1,113 @@
+"""
+shared fixtures: synthetic option chains shaped like the chain api responses
+"""
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import get_options
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def ncdf(x):
+    return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+def black_scholes(underlying, strike, years, vol, put):
+    # (price, delta) without rates or dividends
+    d1 = (math.log(underlying / strike) + 0.5 * vol * vol * years) / (vol * math.sqrt(years))
+    d2 = d1 - vol * math.sqrt(years)
+    if put:
+        return (strike * ncdf(-d2) - underlying * ncdf(-d1), ncdf(d1) - 1)
+    return (underlying * ncdf(d1) - strike * ncdf(d2), ncdf(d1))
+
+def make_option(symbol, strike, put, expire_date, days, underlying, rnd):
+    vol = 0.3 + 0.002 * abs(strike - underlying) + rnd.uniform(-0.01, 0.01)
+    (price, delta) = black_scholes(underlying, strike, days / 365.0, vol, put)
+    price = max(price, 0.0)
+    bid = round(max(price - 0.05, 0), 2)
+    ask = round(price + 0.05, 2)
+    mark = round((bid + ask) / 2, 3)
+    (year, month, day) = expire_date.split("-")
+    option = {}
+    option["putCall"] = "PUT" if put else "CALL"
+    option["symbol"] = f"{symbol}_{month}{day}{year[2:]}{'P' if put else 'C'}{strike:g}"
+    option["description"] = f"{symbol} {MONTHS[int(month) - 1]} {int(day)} {year} {strike:g} {'Put' if put else 'Call'}"
+    option["bid"] = bid
+    option["ask"] = ask
+    option["last"] = round(mark + rnd.uniform(-0.1, 0.1), 2)
+    option["mark"] = mark
+    option["bidAskSize"] = "10X12"
+    option["highPrice"] = 0.0
+    option["lowPrice"] = 0.0
+    option["openPrice"] = 0.0
+    option["closePrice"] = round(mark * 1.01, 3)
+    option["totalVolume"] = rnd.randint(0, 5000)
+    option["netChange"] = round(rnd.uniform(-1, 1), 2)
+    option["volatility"] = round(vol * 100, 3)
+    option["delta"] = round(delta, 3)
+    option["gamma"] = round(rnd.uniform(0, 0.05), 3)
+    option["theta"] = round(-rnd.uniform(0, 0.05), 3)
+    option["vega"] = round(rnd.uniform(0, 0.2), 3)
+    option["openInterest"] = rnd.randint(0, 20000)
+    option["timeValue"] = mark
+    option["theoreticalOptionValue"] = round(price, 3)
+    option["strikePrice"] = strike
+    option["daysToExpiration"] = days
+    return option
+
+def make_chain(symbol="XYZ", underlying=100.0, seed=1, strikes=120, step=0.5,
+        expire_date="2026-12-04", days=47, calls=True, puts=True):
+    """
+    chain response of one expiration with strikes around underlying,
+    calls/puts False leaves that side empty
+    """
+    rnd = random.Random(seed)
+    chain = {"symbol": symbol, "status": "SUCCESS", "underlyingPrice": underlying, "volatility": 29.0,
+        "interestRate": 0.1, "daysToExpiration": 45.0, "putExpDateMap": {}, "callExpDateMap": {}}
+    for (side, put, wanted) in (("putExpDateMap", True, puts), ("callExpDateMap", False, calls)):
+        bundle = {}
+        for n in range(strikes):
+            strike = round(underlying - step * strikes / 2 + step * n, 2)
+            option = make_option(symbol, strike, put, expire_date, days, underlying, rnd)
+            if wanted:
+                bundle[f"{strike:.1f}"] = [option]
+        chain[side][f"{expire_date}:{days}"] = bundle
+    return chain
+
+@pytest.fixture(autouse=True)
+def clean_args():
+    get_options.ARGS.clear()
+    yield
+    get_options.ARGS.clear()
+
+@pytest.fixture
+def loose_requirements(monkeypatch):
+    # more candidates meet the requirements, so the searches have something to rank
+    monkeypatch.setattr(get_options, "MIN_TCW", 15)
+
+@pytest.fixture
+def contracts(loose_requirements):
+    return get_options.get_contracts("XYZ", make_chain(), save=False)
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # auth token and data directory of a run, fetched chains are stored under data/
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "auth_token").write_text("tok\n")
+    (tmp_path / "data").mkdir()
+    return tmp_path
+
+@pytest.fixture
+def save_snapshot(workdir, monkeypatch, capsys):
+    """
+    save_snapshot(date, symbol="XYZ", **chain) stores make_chain(symbol, **chain)
+    as a fetch on date does, returns its contracts
+    """
+    def save(date, symbol="XYZ", **chain):
+        monkeypatch.setattr(get_options, "get_dateString", lambda *args, **kwargs: date)
+        return get_options.get_contracts(symbol, make_chain(symbol, **chain))
+    return save
@@ -0,0 +1,70 @@
+"""
+local stand-in for the chain api, to test ChainFetcher without the network
+"""
+import http.server
+import threading
+import time
+import urllib.parse
+
+
+class StandIn:
+    """
+    http server on a free local port answering ?symbol=SYM with the answers set in
+    answers[SYM] in turn, the last one repeats; an answer is (status, body, headers)
+    every request is kept as (symbol, time, headers), delay holds each answer back
+    """
+
+    def __init__(self, delay=0.0):
+        self.answers = {}
+        self.requests = []
+        self.delay = delay
+        self.max_inflight = 0
+        self._inflight = 0
+        self._lock = threading.Lock()
+        standin = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                standin._answer(self)
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/chains"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def times(self, symbol=None):
+        return [t for (s, t, headers) in self.requests if symbol is None or s == symbol]
+
+    def _answer(self, handler):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(handler.path).query)
+        symbol = query["symbol"][0]
+        with self._lock:
+            count = len(self.times(symbol))
+            self.requests.append((symbol, time.monotonic(), dict(handler.headers)))
+            self._inflight += 1
+            self.max_inflight = max(self.max_inflight, self._inflight)
+        time.sleep(self.delay)
+        answers = self.answers.get(symbol, [(404, "{}", {})])
+        (status, body, headers) = answers[min(count, len(answers) - 1)]
+        body = body.encode()
+        with self._lock:
+            self._inflight -= 1
+        handler.send_response(status)
+        for (name, value) in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
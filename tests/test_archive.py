@@ -0,0 +1,90 @@
+"""
+.snapz archives: column encodings and archive_snapshots
+"""
+import os
+
+import numpy as np
+import pytest
+
+import get_options
+
+def round_trip(propname, array):
+    (column, payload) = get_options.encode_column(propname, array)
+    assert column["nbytes"] == len(payload)
+    return (column["encoding"], get_options.decode_column(column, payload, len(array)))
+
+def same_bits(array, other):
+    return array.dtype == other.dtype and np.array_equal(array.view(np.uint8), other.view(np.uint8))
+
+@pytest.mark.parametrize("propname, values, encoding", [
+    ("mark", [0.0, 1.25, 3.105, 1234.5], "scaled"),
+    ("strikePrice", [95.0, 95.5, 96.0, 97.5, 90.0], "delta"),
+    ("delta", [0.1 + 0.2, 1 / 3, -0.25], "shuffle"),
+    ("delta", [-0.0, 0.5, -0.25], "shuffle"),
+    ("volatility", [float("nan"), 30.5, 31.0], "shuffle"),
+    ("theta", [float("inf"), -float("inf"), 0.0], "shuffle"),
+    ("gamma", [], "scaled"),
+])
+def test_float_columns(propname, values, encoding):
+    array = np.array(values, dtype=float)
+    (found, decoded) = round_trip(propname, array)
+    assert found == encoding
+    assert same_bits(decoded, array)
+
+@pytest.mark.parametrize("dtype", [np.int64, np.int32, ">i8"])
+def test_int_columns(dtype):
+    array = np.array([0, 7, -3, 2**31 - 1, -2**31], dtype=dtype)
+    (encoding, decoded) = round_trip("openInterest", array)
+    assert encoding == "shuffle"
+    assert np.array_equal(decoded, array)
+    assert decoded.dtype == np.dtype(dtype).newbyteorder("<")
+
+def test_string_columns():
+    descs = np.array(["XYZ Dec 4 2026 95 Put", "XYZ Dec 4 2026 95.5 Put", "XYZ Dec 4 2026 100 Call (PM)", ""])
+    (encoding, decoded) = round_trip("description", descs)
+    assert encoding == "words"
+    assert same_bits(decoded, descs)
+    sizes = np.array(["10X12", "1X1", "10X12", ""])
+    (encoding, decoded) = round_trip("bidAskSize", sizes)
+    assert encoding == "dictionary"
+    assert same_bits(decoded, sizes)
+
+@pytest.mark.parametrize("codec", ["lzma", "gzip"])
+def test_deleted_snapshot_is_rebuilt_from_its_archive(save_snapshot, codec, capsys):
+    save_snapshot("2026-09-01", seed=1, strikes=40)
+    save_snapshot("2026-09-02", seed=2, strikes=40)
+    # only the text file of this one
+    os.remove("data/XYZ/XYZ-2026-09-02.snap")
+    originals = {datafile: get_options.load_from_file("XYZ", datafile)
+        for datafile in ("XYZ-2026-09-01", "XYZ-2026-09-02")}
+    header = get_options.read_snapshot_header("data/XYZ/XYZ-2026-09-01.snap")
+
+    get_options.archive_snapshots("XYZ", codec)
+    assert sorted(name for name in os.listdir("data/XYZ") if name.startswith("XYZ-")) == [
+        "XYZ-2026-09-01.snapz", "XYZ-2026-09-02.snapz"]
+    for (datafile, contracts) in originals.items():
+        archived = get_options.load_from_file("XYZ", datafile)
+        assert get_options.same_chains(contracts, archived)
+        for name in ("underlying", "volatility", "interestRate", "expireDate"):
+            assert archived[name] == contracts[name]
+
+    # the .snap back from the archive, header included
+    (meta, columns) = get_options.read_archive("data/XYZ/XYZ-2026-09-01.snapz", header_only=True)
+    meta = {name: meta[name] for name in meta if name not in ("nput", "ncall", "columns")}
+    archived = get_options.load_from_file("XYZ", "XYZ-2026-09-01")
+    with open("data/XYZ/XYZ-2026-09-01.snap", "wb") as f:
+        f.write(get_options.snapshot_bytes(meta, archived["put"], archived["call"]))
+    rebuilt = get_options.load_snapshot("data/XYZ/XYZ-2026-09-01.snap")
+    assert get_options.same_chains(originals["XYZ-2026-09-01"], rebuilt)
+    rebuilt_header = get_options.read_snapshot_header("data/XYZ/XYZ-2026-09-01.snap")
+    for name in ("symbol", "underlying", "expireDate", "daysToExpiration", "timestamp", "nput", "ncall"):
+        assert rebuilt_header[name] == header[name]
+
+def test_mismatching_archive_keeps_the_snapshot(save_snapshot, monkeypatch, caplog, capsys):
+    save_snapshot("2026-09-01", seed=1, strikes=20)
+    monkeypatch.setattr(get_options, "same_chains", lambda contracts, other: False)
+    get_options.archive_snapshots("XYZ")
+    names = os.listdir("data/XYZ")
+    assert "XYZ-2026-09-01.snap" in names and "XYZ-2026-09-01.txt" in names
+    assert "XYZ-2026-09-01.snapz" not in names
+    assert "archive of XYZ-2026-09-01 does not match" in caplog.text
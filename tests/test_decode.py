@@ -0,0 +1,86 @@
+"""
+decode_chain_response against json.loads of the same response
+"""
+import json
+
+import pytest
+
+import get_options
+from conftest import make_chain
+
+TRICKY = ['plain', 'a "quoted" word', 'back\\slash\\', 'brackets ]}[{ and ,:', '\\"}', 'tab\tnew\nline',
+    'unicode é中 \U0001f600', '']
+
+def tricky_chain():
+    # two expirations, and values the skipping has to step over without miscounting brackets
+    chain = make_chain(strikes=12)
+    later = make_chain(strikes=12, seed=2, expire_date="2026-12-11", days=54)
+    for side in ("putExpDateMap", "callExpDateMap"):
+        chain[side].update(later[side])
+        for bundle in chain[side].values():
+            for (n, options) in enumerate(bundle.values()):
+                options[0]["optionDeliverablesList"] = [{"symbol": TRICKY[n % len(TRICKY)], "units": [1, [2, {}]]}]
+                options[0]["exchangeName"] = TRICKY[(n + 3) % len(TRICKY)]
+                options[0]["nonStandard"] = n % 2 == 0
+                options[0]["expirationType"] = None
+    chain["underlying"] = {"symbol": "XYZ", "description": TRICKY[3], "quote": [TRICKY[4], {"last": 100.0}]}
+    chain["strategy"] = TRICKY[1]
+    chain["isDelayed"] = False
+    chain["numberOfContracts"] = 48
+    chain["intervals"] = []
+    return chain
+
+def expected(text):
+    # json.loads, then what decode_chain_response keeps of it
+    chains = {}
+    for (key, value) in json.loads(text).items():
+        if key in ("putExpDateMap", "callExpDateMap"):
+            first = next(iter(value), None)
+            value = {} if first is None else {first: {strike: [{propname: option[propname] for propname in get_options.OPTION_PROPS}
+                for option in options] for (strike, options) in value[first].items()}}
+        elif isinstance(value, (dict, list)):
+            continue
+        chains[key] = value
+    return chains
+
+@pytest.mark.parametrize("dumps", [
+    {},
+    {"indent": 2},
+    {"separators": (",", ":")},
+    {"ensure_ascii": False},
+    {"indent": "\t", "ensure_ascii": False},
+])
+def test_same_as_json_loads(dumps):
+    text = json.dumps(tricky_chain(), **dumps)
+    decoded = get_options.decode_chain_response(text)
+    assert decoded == expected(text)
+    assert list(decoded["putExpDateMap"]) == ["2026-12-04:47"]
+    assert "underlying" not in decoded and decoded["strategy"] == TRICKY[1]
+
+def test_same_contracts(capsys):
+    text = json.dumps(tricky_chain(), indent=1)
+    contracts = get_options.get_contracts("XYZ", get_options.decode_chain_response(text), save=False)
+    assert get_options.same_chains(contracts, get_options.get_contracts("XYZ", json.loads(text), save=False))
+
+def test_empty_maps():
+    text = json.dumps({"symbol": "XYZ", "status": "FAILED", "putExpDateMap": {}, "callExpDateMap": {}})
+    assert get_options.decode_chain_response(text) == expected(text)
+
+@pytest.mark.parametrize("text", ["<html>busy</html>", "", "  ", '{"symbol": "XYZ"', '{"symbol": "XYZ",',
+    '{"a": {"b": [1,', '{"a": "}', '{"putExpDateMap": {"x": {', '{"putExpDateMap": {"x": {}, "y": {"z": [', '{"a" 1}'])
+def test_bad_text_raises_value_error(text):
+    # as json.loads does, the fetch reports these as bad answers
+    with pytest.raises(ValueError):
+        json.loads(text)
+    with pytest.raises(ValueError):
+        get_options.decode_chain_response(text)
+
+def test_not_an_object():
+    with pytest.raises(ValueError, match="expected json object"):
+        get_options.decode_chain_response("[]")
+
+def test_truncated_answer_is_a_bad_answer():
+    text = json.dumps(tricky_chain())
+    for end in range(0, len(text) - 1, 997):
+        with pytest.raises(ValueError):
+            get_options.decode_chain_response(text[:end])
@@ -0,0 +1,93 @@
+"""
+ChainFetcher and refresh_chains against the local stand-in server
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+import get_options
+from conftest import make_chain
+from standin import StandIn
+
+DT_MIN = datetime(2026, 11, 28)
+DT_MAX = datetime(2026, 12, 17)
+
+@pytest.fixture
+def standin():
+    server = StandIn().start()
+    yield server
+    server.stop()
+
+def ok(symbol):
+    return (200, json.dumps(make_chain(symbol, strikes=20)), {})
+
+def fetcher(standin, concurrency=4, rate=1000.0, retries=3, backoff=0.01):
+    return get_options.ChainFetcher(standin.url, concurrency, rate, retries, backoff)
+
+def test_retries_429_and_5xx(workdir, standin, capsys):
+    standin.answers["AAA"] = [(429, "{}", {}), (503, "{}", {}), (500, "{}", {}), ok("AAA")]
+    chains = fetcher(standin).fetch("AAA", DT_MIN, DT_MAX)
+    assert chains["symbol"] == "AAA"
+    assert len(standin.times("AAA")) == 4
+    assert standin.requests[0][2]["Authorization"] == "Bearer tok"
+
+def test_gives_up_after_the_retries(workdir, standin):
+    standin.answers["AAA"] = [(502, "{}", {})]
+    assert fetcher(standin, retries=2).fetch("AAA", DT_MIN, DT_MAX) is None
+    assert len(standin.times("AAA")) == 3
+
+def test_other_errors_are_not_retried(workdir, standin):
+    standin.answers["AAA"] = [(401, "{}", {}), ok("AAA")]
+    assert fetcher(standin).fetch("AAA", DT_MIN, DT_MAX) is None
+    assert len(standin.times("AAA")) == 1
+
+def test_waits_for_retry_after(workdir, standin, capsys):
+    standin.answers["AAA"] = [(429, "{}", {"Retry-After": "1"}), ok("AAA")]
+    assert fetcher(standin).fetch("AAA", DT_MIN, DT_MAX) is not None
+    (first, second) = standin.times("AAA")
+    assert second - first >= 0.95
+
+def test_rate_and_concurrency_limits(workdir, capsys):
+    standin = StandIn(delay=0.05).start()
+    try:
+        symbols = [f"S{n:02}" for n in range(16)]
+        for symbol in symbols:
+            standin.answers[symbol] = [ok(symbol)]
+        (concurrency, rate) = (3, 20.0)
+        results = list(fetcher(standin, concurrency, rate).fetch_all(symbols, DT_MIN, DT_MAX))
+    finally:
+        standin.stop()
+    assert [symbol for (symbol, chains) in results] == symbols
+    assert all(chains is not None for (symbol, chains) in results)
+    assert standin.max_inflight <= concurrency
+    # token bucket: at most the burst of concurrency plus rate per second in any window
+    times = standin.times()
+    for (n, start) in enumerate(times):
+        for (m, end) in enumerate(times[n:]):
+            assert m + 1 <= concurrency + rate * (end - start) + 1
+
+def test_bad_answers_skip_only_their_symbol(workdir, standin, monkeypatch, capsys, caplog):
+    caplog.set_level("INFO")
+    monkeypatch.setattr(get_options, "CHAINS_URL", standin.url)
+    monkeypatch.setattr(get_options, "FETCH_BACKOFF", 0.01)
+    monkeypatch.setattr(get_options, "FETCH_RATE", 1000.0)
+    monkeypatch.setattr(get_options, "FETCHER", {})
+    standin.answers["AAA"] = [ok("AAA")]
+    # not json, no status, an option get_options() exits on, and a failed fetch
+    standin.answers["BBB"] = [(200, "<html>busy</html>", {})]
+    standin.answers["CCC"] = [(200, json.dumps({"symbol": "CCC"}), {})]
+    chain = make_chain("DDD", strikes=20)
+    for bundle in chain["putExpDateMap"].values():
+        for options in bundle.values():
+            options[0]["description"] = "DDD unknown"
+    standin.answers["DDD"] = [(200, json.dumps(chain), {})]
+    standin.answers["EEE"] = [(500, "{}", {})]
+    standin.answers["FFF"] = [ok("FFF")]
+
+    saved = get_options.refresh_chains(["AAA", "BBB", "CCC", "DDD", "EEE", "FFF"])
+    assert saved == ["AAA", "FFF"]
+    assert sorted(os.listdir(workdir / "data")) == ["AAA", "FFF", "raw"]
+    assert "unexpected description: DDD unknown" in caplog.text
@@ -0,0 +1,64 @@
+"""
+compacted history partitions and --query
+"""
+import os
+
+import numpy as np
+import pytest
+
+import get_options
+
+@pytest.fixture
+def history(save_snapshot):
+    # a text only snapshot (no daysToExpiration column) in one partition, binary ones in the next
+    saved = [save_snapshot("2026-08-03", seed=1, strikes=20)]
+    os.remove("data/XYZ/XYZ-2026-08-03.snap")
+    saved.append(save_snapshot("2026-09-01", seed=2, strikes=20))
+    saved.append(save_snapshot("2026-09-02", seed=3, strikes=20))
+    get_options.compact_history("XYZ")
+    # put and call rows of each snapshot
+    return [(len(contracts["put"]), len(contracts["call"])) for contracts in saved]
+
+def test_columns_line_up_across_partitions(history, caplog):
+    rows = get_options.query_history("XYZ")
+    assert "daysToExpiration" not in rows
+    assert {len(column) for column in rows.values()} == {sum(map(sum, history))}
+    assert sorted(set(rows["date"].tolist())) == [20260803, 20260901, 20260902]
+
+    rows = get_options.query_history("XYZ", ["date", "daysToExpiration", "delta"], put_call="PUT")
+    assert list(rows) == ["date", "delta"]
+    assert len(rows["date"]) == len(rows["delta"]) == sum(nput for (nput, ncall) in history)
+    assert "left out: ['daysToExpiration']" in caplog.text
+
+    # every partition read has the column
+    rows = get_options.query_history("XYZ", ["date", "daysToExpiration"], date_min="2026-09-01")
+    assert len(rows["date"]) == len(rows["daysToExpiration"]) == sum(map(sum, history[1:]))
+
+def test_filters(history):
+    rows = get_options.query_history("XYZ", ["date", "putCall", "delta", "strikePrice"],
+        date_max="2026-09-01", put_call="CALL", delta_range=(0.2, 0.4), strike_range=(100, 104))
+    assert len(rows["date"])
+    assert set(rows["date"].tolist()) <= {20260803, 20260901}
+    assert set(rows["putCall"].tolist()) == {"CALL"}
+    assert np.all((rows["delta"] >= 0.2) & (rows["delta"] <= 0.4))
+    assert np.all((rows["strikePrice"] >= 100) & (rows["strikePrice"] <= 104))
+
+def test_print_query(history, capsys):
+    capsys.readouterr()
+    get_options.print_history_query("XYZ", "type=put delta=-0.5:-0.2 columns=date,delta,daysToExpiration")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["date,", "delta"]
+    assert lines[-1].startswith(f"{len(lines) - 2} rows in ")
+
+@pytest.mark.parametrize("spec, message", [
+    ("columns=date,foo", "unknown column: foo"),
+    ("type=puts", "unknown option type: PUTS"),
+    ("delta=0.2", "delta has to be MIN:MAX"),
+    ("strike=1:2:3", "strike has to be MIN:MAX"),
+    ("delta=low:high", "could not convert"),
+    ("from=2026-09-01 nonsense", "expected name=value"),
+    ("size=2", "unknown query filter: size"),
+])
+def test_bad_query(history, spec, message):
+    with pytest.raises(ValueError, match=message):
+        get_options.print_history_query("XYZ", spec)
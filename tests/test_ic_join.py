@@ -0,0 +1,74 @@
+"""
+the default IC join against the baseline one: every call spread with every put spread
+"""
+import numpy as np
+
+import get_options
+
+def spread_lists(contracts):
+    # the call and put spreads of the IC delta bands, as the IC search builds them
+    lists = []
+    for (get_spreads, legnames, ranges) in (
+            (get_options.get_call_spreads, ("cs", "cb"), (get_options.IC_CS_DELTA_RANGE, get_options.IC_CB_DELTA_RANGE)),
+            (get_options.get_put_spreads, ("ps", "pb"), (get_options.IC_PS_DELTA_RANGE, get_options.IC_PB_DELTA_RANGE))):
+        sink = get_options.ListSink()
+        get_spreads(contracts, *ranges, sink)
+        lists.append(get_options.concat_blocks(contracts, legnames, sink.blocks()))
+    return lists
+
+def baseline_ic_props(calls, puts, underlying):
+    # the IC props of every (call spread, put spread) pair with the expressions of the baseline Candidate
+    (css, csp, csd) = [column[:, None] for column in calls.leg_arrays("cs")]
+    (cbs, cbp, cbd) = [column[:, None] for column in calls.leg_arrays("cb")]
+    (pss, psp, psd) = [column[None, :] for column in puts.leg_arrays("ps")]
+    (pbs, pbp, pbd) = [column[None, :] for column in puts.leg_arrays("pb")]
+    tc = csp - cbp + psp - pbp
+    width = np.where(cbs - css < psp - pbp, psp - pbp, cbs - css)
+    etca = tc * (1.0 - csd + psd)
+    delta_cc = tc * (csd - cbd) / (cbs - css)
+    delta_pc = tc * (psd - pbd) / (pss - pbs)
+    delta_cd = csd - cbd - delta_cc
+    delta_pd = psd - pbd - delta_pc
+    tcl = cbs - css - tc
+    tpl = pss - pbs - tc
+    props = {}
+    props["tc"] = tc
+    props["et"] = (etca + 0.5 * tc * delta_cc - 0.5 * tcl * delta_cd - 0.5 * tc * delta_pc
+        + 0.5 * tpl * delta_pd - tcl * cbd + tpl * pbd)
+    props["tc_w"] = 100 * (tc / width)
+    props["tc_u"] = 100 * (tc / underlying)
+    props["beven"] = 100 * (1.0 - csd + psd + delta_cc - delta_pc)
+    return props
+
+def search_ics(contracts, **options):
+    get_options.set_args(get_options.scan_settings(dict({"sort_key": "et"}, **options)))
+    return get_options.get_ic_candidates(contracts, sink=get_options.ListSink())
+
+def test_default_join_is_the_baseline_join(contracts, capsys):
+    found = search_ics(contracts)
+    (calls, puts) = spread_lists(contracts)
+    props = baseline_ic_props(calls, puts, contracts["underlying"])
+    mask = ~(props["et"] < get_options.MIN_ET)
+    mask &= ~(props["tc"] < get_options.MIN_TC)
+    mask &= ~(props["tc_w"] < get_options.MIN_TCW)
+    mask &= ~(props["tc_u"] < get_options.MIN_TCU)
+    # call spreads outside, put spreads inside, as the baseline loops
+    (call_n, put_n) = np.nonzero(mask)
+
+    block = found[0].block
+    assert len(block) == len(call_n)
+    for leg in ("cs", "cb"):
+        assert np.array_equal(block.legs[leg], calls.legs[leg][call_n])
+    for leg in ("ps", "pb"):
+        assert np.array_equal(block.legs[leg], puts.legs[leg][put_n])
+    # the same bits, except et which is etc + etp
+    for name in ("tc", "tc_w", "tc_u", "beven"):
+        assert np.array_equal(block.props[name], props[name][mask])
+    np.testing.assert_allclose(block.props["et"], props["et"][mask], rtol=0, atol=1e-14)
+
+def test_symmetry_check_is_opt_in(contracts, capsys):
+    every = search_ics(contracts)
+    symmetric = search_ics(contracts, symmetry=True)
+    assert 0 < len(symmetric) < len(every)
+    pairs = {candidate.strikes() for candidate in every}
+    assert all(candidate.strikes() in pairs for candidate in symmetric)
@@ -0,0 +1,93 @@
+"""
+snapshot manifest and the data file lookup through it
+"""
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import get_options
+
+DATES = ["2026-08-28", "2026-09-01", "2026-09-02", "2026-09-04"]
+
+@pytest.fixture
+def snapshots(save_snapshot):
+    for (n, date) in enumerate(DATES):
+        save_snapshot(date, seed=n, strikes=10, underlying=100.0 + n)
+
+def lookup(dt_min=None, dt_max=None, useold=False):
+    return get_options.get_data_filename("XYZ",
+        dt_min and datetime.fromisoformat(dt_min), dt_max and datetime.fromisoformat(dt_max), useold)
+
+def read_manifest():
+    with open(f"data/XYZ/{get_options.MANIFEST_FILENAME}") as f:
+        return json.load(f)
+
+def test_manifest_entries(snapshots):
+    manifest = read_manifest()
+    assert [entry["date"] for entry in manifest] == DATES
+    assert [entry["file"] for entry in manifest] == [f"XYZ-{date}" for date in DATES]
+    assert [entry["underlying"] for entry in manifest] == [100.0, 101.0, 102.0, 103.0]
+    assert {entry["expireDate"] for entry in manifest} == {"2026-12-04"}
+
+def test_refetch_replaces_its_entry(snapshots, save_snapshot):
+    save_snapshot("2026-09-01", strikes=10, underlying=110.0)
+    save_snapshot("2026-08-30", strikes=10)
+    manifest = read_manifest()
+    assert [entry["date"] for entry in manifest] == sorted(DATES + ["2026-08-30"])
+    assert manifest[2]["underlying"] == 110.0
+
+@pytest.mark.parametrize("dt_min, dt_max, useold, datafile", [
+    (None, None, False, "XYZ-2026-09-04"),
+    ("2026-09-01", "2026-09-03", False, "XYZ-2026-09-02"),
+    ("2026-09-02", "2026-09-02", False, "XYZ-2026-09-02"),
+    # later in the day than the file of that date
+    ("2026-09-02T10:00", "2026-09-03", False, None),
+    ("2026-09-02T10:00", "2026-09-04T09:00", False, "XYZ-2026-09-04"),
+    ("2026-08-29", "2026-08-31", False, None),
+    ("2026-08-29", "2026-08-31", True, "XYZ-2026-09-04"),
+    ("2026-10-01", None, True, "XYZ-2026-09-04"),
+])
+def test_newest_file_in_range(snapshots, dt_min, dt_max, useold, datafile):
+    assert lookup(dt_min, dt_max, useold) == datafile
+
+def test_manifest_is_built_for_an_older_directory(snapshots):
+    # text snapshots only, read back to the entries get_contracts wrote
+    expected = read_manifest()
+    os.remove(f"data/XYZ/{get_options.MANIFEST_FILENAME}")
+    for date in DATES:
+        os.remove(f"data/XYZ/XYZ-{date}.snap")
+    assert lookup("2026-08-01", "2026-09-03") == "XYZ-2026-09-02"
+    assert read_manifest() == expected
+
+def test_no_data_directory(workdir):
+    assert get_options.get_data_filename("XYZ") is None
+
+def test_file_deleted_by_hand(snapshots, caplog):
+    for extension in (".snap", ".txt"):
+        os.remove(f"data/XYZ/XYZ-2026-09-04{extension}")
+    # the same mtime as the directory, as on a file system with coarse timestamps
+    os.utime(f"data/XYZ/{get_options.MANIFEST_FILENAME}", ns=(0, os.stat("data/XYZ").st_mtime_ns))
+    datafile = lookup(useold=True)
+    assert datafile == "XYZ-2026-09-02"
+    assert "XYZ-2026-09-04 of the manifest is gone" in caplog.text
+    assert get_options.load_from_file("XYZ", datafile)["underlying"] == 102.0
+    assert [entry["date"] for entry in read_manifest()] == DATES[:3]
+
+def test_file_added_by_hand(snapshots, monkeypatch):
+    with open("data/XYZ/XYZ-2026-09-04.txt") as f:
+        text = f.read()
+    with open("data/XYZ/XYZ-2026-09-10.txt", "w") as f:
+        f.write(text)
+    # only the new file is read
+    entries = []
+    snapshot_entry = get_options.snapshot_entry
+    monkeypatch.setattr(get_options, "snapshot_entry",
+        lambda symbol, datafile: entries.append(datafile) or snapshot_entry(symbol, datafile))
+    assert lookup() == "XYZ-2026-09-10"
+    assert entries == ["XYZ-2026-09-10"]
+    assert [entry["date"] for entry in read_manifest()] == DATES + ["2026-09-10"]
+    # up to date again
+    assert lookup() == "XYZ-2026-09-10"
+    assert entries == ["XYZ-2026-09-10"]
@@ -0,0 +1,42 @@
+"""
+CandidateBlock.rank: order and rank of every property, ties keep the generation order
+"""
+import numpy as np
+import pytest
+
+import get_options
+
+def put_block(contracts, props):
+    # put spreads in generation order with the given prop values
+    count = len(next(iter(props.values())))
+    legs = {"ps": np.arange(count) + 1, "pb": np.arange(count)}
+    props = {name: np.array(values, dtype=float) for (name, values) in props.items()}
+    return get_options.CandidateBlock(contracts, legs, np.arange(count), props)
+
+def ranked(contracts, name, values):
+    block = put_block(contracts, {name: values})
+    block.rank()
+    return (block.order_column(name).tolist(), block.rank_column(name).tolist())
+
+@pytest.mark.parametrize("name, values, orders, ranks", [
+    # descending, exact ties keep the generation order and share the rank
+    ("etp", [0.2, 0.5, 0.2, 0.5, 0.1], [3, 1, 4, 2, 5], [3, 1, 3, 1, 5]),
+    # ascending for NON_REVERSE_SORT
+    ("width", [2.0, 1.0, 2.0, 0.5], [3, 2, 4, 1], [3, 2, 3, 1]),
+    # a rank is shared within 0.001 of the previous value, so it can run on
+    ("etp", [1.0, 0.9995, 0.999, 0.9985, 0.99], [1, 2, 3, 4, 5], [1, 1, 1, 1, 5]),
+    # no new rank after a zero value
+    ("etp", [0.5, 0.0, -0.5, -0.6], [1, 2, 3, 4], [1, 2, 2, 4]),
+])
+def test_order_and_rank(contracts, name, values, orders, ranks):
+    assert ranked(contracts, name, values) == (orders, ranks)
+
+def test_ties_do_not_depend_on_the_other_props(contracts):
+    # the old per property sorts left ties in the order of the property sorted before
+    values = {"etp": [0.3, 0.3, 0.3, 0.3], "tcp": [0.1, 0.4, 0.2, 0.3], "width": [1.0, 0.5, 2.0, 0.5]}
+    for names in (("etp", "tcp", "width"), ("width", "tcp", "etp"), ("etp",)):
+        block = put_block(contracts, {name: values[name] for name in names})
+        block.rank()
+        assert block.order_column("etp").tolist() == [1, 2, 3, 4]
+        assert [candidate.strikes() for candidate in block.sorted_candidates("etp")] == \
+            [block.candidate(n).strikes() for n in range(4)]
@@ -0,0 +1,89 @@
+"""
+--record result lines and the summary make_summary.py builds from them
+"""
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import get_options
+
+MAKE_SUMMARY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "make_summary.py")
+SEARCH = {
+    "IC": get_options.get_ic_candidates,
+    "put": get_options.get_candidates_put,
+    "call": get_options.get_candidates_call,
+}
+
+def run(contracts, filename, **options):
+    outputs = {mode: io.StringIO() for mode in get_options.SCAN_MODES}
+    get_options.run_scan("XYZ", contracts, "", get_options.SCAN_MODES, outputs, record=filename, **options)
+    with open(filename) as f:
+        return [json.loads(line) for line in f]
+
+def all_candidates(contracts, kind):
+    get_options.set_args(get_options.scan_settings({"sort_key": get_options.RECORD_BEST_KEYS[kind]}))
+    return SEARCH[kind](contracts, sink=get_options.ListSink())
+
+def test_record_holds_the_best_candidate(workdir, contracts):
+    records = run(contracts, "results.jsonl")
+    assert [record["kind"] for record in records] == list(get_options.SCAN_MODES)
+    for record in records:
+        kind = record["kind"]
+        candidates = all_candidates(contracts, kind)
+        key = get_options.RECORD_BEST_KEYS[kind]
+        assert record["symbol"] == "XYZ"
+        assert record["underlying"] == contracts["underlying"]
+        assert record["expireDate"] == contracts["expireDate"]
+        assert record["count"] == len(candidates)
+        best = record["best"]
+        assert best[key] == max(candidate.get_prop(key) for candidate in candidates)
+        found = [candidate for candidate in candidates if candidate.strikes() == best["strikes"]]
+        assert len(found) == 1
+        assert set(best) == {"strikes"} | set(get_options.KIND_PROPS[kind])
+        for propname in get_options.KIND_PROPS[kind]:
+            assert best[propname] == found[0].get_prop(propname)
+
+@pytest.mark.parametrize("options", [{"top": 3, "sort_key": "width"}, {"count_only": True}])
+def test_record_counts_every_candidate(workdir, contracts, options):
+    records = run(contracts, "results.jsonl", **options)
+    for record in records:
+        assert record["count"] == len(all_candidates(contracts, record["kind"]))
+    if "count_only" in options:
+        assert all(record["best"] is None for record in records)
+
+def summary(stocklist):
+    with open("stocks.csv", "w") as f:
+        f.write(stocklist)
+    done = subprocess.run([sys.executable, MAKE_SUMMARY, "stocks.csv", "."], capture_output=True, text=True)
+    assert done.returncode == 0, done.stderr
+    lines = done.stdout.splitlines()
+    assert lines[2].startswith("SYMBOL,UNDERLYING,NUM,MAX ET,")
+    return ({line.split(",")[0]: line.split(",") for line in lines[3:]}, done.stderr)
+
+def test_summary_of_the_records(workdir, contracts):
+    records = {record["kind"]: record for record in run(contracts, "results.jsonl")}
+    (rows, errors) = summary("XYZ,some name\nnot a symbol\nABC\n")
+    assert list(rows) == ["XYZ", "ABC"]
+    row = rows["XYZ"]
+    assert row[1] == f"${contracts['underlying']}"
+    for (start, kind, props) in ((2, "IC", ("et", "tc", "tc_w", "tc_u", "beven")),
+            (9, "call", ("etc", "tcc", "tcc_w", "tcc_u", "bevenc")),
+            (16, "put", ("etp", "tcp", "tcp_w", "tcp_u", "bevenp"))):
+        best = records[kind]["best"]
+        assert row[start] == str(records[kind]["count"])
+        assert row[(start + 1):(start + 6)] == [f"{best[propname]:.3f}" for propname in props]
+        assert row[start + 6] == best["strikes"]
+    # no records for ABC
+    assert rows["ABC"][1:4] == ["$0.0", "0", "0.000"]
+    assert "ABC: no IC result" in errors
+
+def test_summary_takes_the_last_run(workdir, contracts):
+    run(contracts, "results.jsonl")
+    records = run(contracts, "results.jsonl", count_only=True)
+    assert len(records) == 6
+    (rows, errors) = summary("XYZ\n")
+    assert rows["XYZ"][2:4] == [str(records[3]["count"]), "0.000"]
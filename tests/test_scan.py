@@ -0,0 +1,57 @@
+"""
+several modes in one run_scan() (shared spreads) against one run_scan() per mode
+"""
+import io
+
+import pytest
+
+import get_options
+
+def scan(contracts, modes, **options):
+    outputs = {mode: io.StringIO() for mode in modes}
+    records = get_options.run_scan("XYZ", contracts, "", modes, outputs, **options)
+    for mode in modes:
+        del records[mode]["runtime"]
+    return ({mode: outputs[mode].getvalue() for mode in modes}, records)
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"top": 5},
+    {"top": 4, "sort_key": "width"},
+    {"sort_key": "width"},
+    {"count_only": True},
+    {"skip_delta": True},
+    {"workers": 2},
+    {"top": 3, "workers": 2},
+])
+def test_combined_modes_match_separate_runs(contracts, options):
+    combined = scan(contracts, get_options.SCAN_MODES, **options)
+    for mode in get_options.SCAN_MODES:
+        separate = scan(contracts, (mode,), **options)
+        assert combined[0][mode] == separate[0][mode]
+        assert combined[1][mode] == separate[1][mode]
+
+def test_combined_modes_write_a_csv_file_each(contracts, tmp_path):
+    filename = str(tmp_path / "out.csv")
+    scan(contracts, get_options.SCAN_MODES, csv=filename)
+    combined = {}
+    for mode in get_options.SCAN_MODES:
+        with open(get_options.mode_filename(filename, mode)) as f:
+            combined[mode] = f.read()
+    for mode in get_options.SCAN_MODES:
+        scan(contracts, (mode,), csv=filename)
+        with open(filename) as f:
+            assert f.read() == combined[mode]
+    assert len(set(combined.values())) == 3
+
+def test_csv_file_is_closed_when_the_search_raises(contracts, tmp_path, monkeypatch):
+    sinks = []
+    make_sink = get_options.make_sink
+    monkeypatch.setattr(get_options, "make_sink", lambda kind: sinks.append(make_sink(kind)) or sinks[-1])
+    def search(contracts, sink, spreads=None):
+        raise RuntimeError("search failed")
+    monkeypatch.setattr(get_options, "get_candidates_put", search)
+    with pytest.raises(RuntimeError):
+        scan(contracts, ("put",), csv=str(tmp_path / "out.csv"))
+    assert isinstance(sinks[0], get_options.CsvSink)
+    assert sinks[0]._f.closed
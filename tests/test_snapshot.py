@@ -0,0 +1,145 @@
+"""
+binary snapshots against the contracts they were written from and the text snapshot
+"""
+import os
+
+import numpy as np
+import pytest
+
+import get_options
+from conftest import make_chain
+
+def text_contracts(symbol, datafile):
+    # the text snapshot alone, as directories from before the binary snapshots have it
+    os.rename(f"data/{symbol}/{datafile}.snap", f"data/{symbol}/{datafile}.snap.away")
+    try:
+        return get_options.load_from_file(symbol, datafile)
+    finally:
+        os.rename(f"data/{symbol}/{datafile}.snap.away", f"data/{symbol}/{datafile}.snap")
+
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_snapshot_loads_the_saved_contracts(save_snapshot, fixed_point):
+    get_options.ARGS["fixed_point"] = fixed_point
+    contracts = save_snapshot("2026-09-01", strikes=40)
+    loaded = get_options.load_from_file("XYZ", "XYZ-2026-09-01")
+    assert get_options.same_chains(contracts, loaded)
+    for option_type in ("put", "call"):
+        assert loaded[option_type].scales == contracts[option_type].scales
+        # views of the read only mapping, not copies
+        assert not loaded[option_type].stored_column("delta").flags.writeable
+    for name in ("underlying", "volatility", "interestRate", "expireDate"):
+        assert loaded[name] == contracts[name]
+
+    header = get_options.read_snapshot_header("data/XYZ/XYZ-2026-09-01.snap")
+    assert (header["nput"], header["ncall"]) == (len(contracts["put"]), len(contracts["call"]))
+    assert header["data_start"] % 8 == 0
+    assert os.path.getsize("data/XYZ/XYZ-2026-09-01.snap") % 8 == 0
+
+def test_snapshot_matches_the_text_snapshot(save_snapshot):
+    save_snapshot("2026-09-01", strikes=40)
+    binary = get_options.load_from_file("XYZ", "XYZ-2026-09-01")
+    text = text_contracts("XYZ", "XYZ-2026-09-01")
+    for option_type in ("put", "call"):
+        chain = binary[option_type]
+        text_chain = text[option_type]
+        assert len(chain) == len(text_chain)
+        # the text snapshot has no daysToExpiration column
+        assert set(text_chain.get_propnames()) == set(chain.get_propnames()) - {"daysToExpiration"}
+        for propname in text_chain.get_propnames():
+            column = chain.column(propname)
+            text_column = text_chain.column(propname)
+            assert text_column.dtype.kind == column.dtype.kind
+            if propname == "description":
+                assert text_column.tolist() == column.tolist()
+            elif column.dtype.kind == "U":
+                # the option symbols are longer than the 12 chars of a text column
+                assert text_column.tolist() == [value[:12] for value in column.tolist()]
+            elif column.dtype.kind == "f":
+                # 3 decimals in the text
+                np.testing.assert_allclose(text_column, column, rtol=0, atol=0.0005 + 1e-9)
+            else:
+                assert np.array_equal(text_column, column)
+
+def log_snapshots(symbol, timestamps):
+    # a snapshot of its own chain logged at each timestamp, returns the contracts
+    os.makedirs(f"data/{symbol}", exist_ok=True)
+    logged = []
+    for (n, timestamp) in enumerate(timestamps):
+        contracts = get_options.get_contracts(symbol, make_chain(symbol, seed=n, strikes=10, underlying=100.0 + n), save=False)
+        meta = {"symbol": symbol, "underlying": contracts["underlying"], "volatility": contracts["volatility"],
+            "interestRate": contracts["interestRate"], "expireDate": contracts["expireDate"], "timestamp": timestamp}
+        get_options.append_snapshot_log(symbol, timestamp, get_options.snapshot_bytes(meta, contracts["put"], contracts["call"]))
+        logged.append(contracts)
+    return logged
+
+@pytest.mark.parametrize("timestamp, n", [
+    (1000.0, 0),
+    (1500.0, 0),
+    (2000.0, 1),
+    # nearer to the second, then nearer to the third, a tie goes to the earlier one
+    (2200.0, 1),
+    (2800.0, 2),
+    (2500.0, 1),
+    (4000.0, 3),
+    (9000.0, 3),
+])
+def test_log_snapshot_nearest_to_a_time(workdir, timestamp, n, capsys):
+    logged = log_snapshots("XYZ", [1000.0, 2000.0, 3000.0, 4000.0])
+    contracts = get_options.load_snapshot_log("XYZ", timestamp)
+    assert get_options.same_chains(contracts, logged[n])
+    assert contracts["underlying"] == 100.0 + n
+    assert f"log snapshot {n+1}/4 taken " in capsys.readouterr().out
+
+def test_log_keeps_every_fetch(save_snapshot, capsys):
+    first = save_snapshot("2026-09-01", seed=1, strikes=10)
+    second = save_snapshot("2026-09-01", seed=2, strikes=10)
+    # the daily snapshot is the later fetch, the log has both
+    assert get_options.same_chains(get_options.load_from_file("XYZ", "XYZ-2026-09-01"), second)
+    index = np.fromfile("data/XYZ/XYZ.idx", dtype=get_options.LOG_INDEX_DTYPE)
+    assert len(index) == 2
+    assert index["offset"][1] == index["length"][0]
+    assert index["length"][1] == os.path.getsize("data/XYZ/XYZ-2026-09-01.snap")
+    for (record, contracts) in zip(index, (first, second)):
+        assert get_options.same_chains(get_options.load_snapshot("data/XYZ/XYZ.log", int(record["offset"])), contracts)
+    assert get_options.same_chains(get_options.load_snapshot_log("XYZ", float(index["timestamp"][0])), first)
+
+def test_no_log(workdir):
+    assert get_options.load_snapshot_log("XYZ", 1000.0) is None
+
+def edit_text_snapshot(filename, edits):
+    # set the fields {(row, propname): text} of a text snapshot, rows count from the first option
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    propnames = [field.strip() for field in lines[5][1:].split(",")]
+    for ((row, propname), text) in edits.items():
+        fields = lines[6 + row].split(",")
+        fields[propnames.index(propname)] = f"{text:>12}"
+        lines[6 + row] = ",".join(fields)
+    with open(filename, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def test_text_fields_that_are_not_plain_numbers(save_snapshot, caplog):
+    save_snapshot("2026-09-01", strikes=20)
+    os.remove("data/XYZ/XYZ-2026-09-01.snap")
+    before = get_options.load_from_file("XYZ", "XYZ-2026-09-01")
+    edit_text_snapshot("data/XYZ/XYZ-2026-09-01.txt", {
+        (0, "totalVolume"): "516.000",
+        (1, "openInterest"): "",
+        (2, "openInterest"): "None",
+        (3, "delta"): "None",
+        (4, "gamma"): "",
+        (5, "vega"): "nan",
+    })
+    after = get_options.load_from_file("XYZ", "XYZ-2026-09-01")
+    puts = after["put"]
+    assert puts.column("totalVolume")[0] == 516
+    assert puts.column("totalVolume").dtype == np.int64
+    assert puts.column("openInterest")[1:3].tolist() == [0, 0]
+    assert np.isnan(puts.column("delta")[3]) and np.isnan(puts.column("gamma")[4]) and np.isnan(puts.column("vega")[5])
+    assert "openInterest: 2 fields that are not numbers, like [" in caplog.text
+    assert "vega" not in caplog.text
+    # the rest as before
+    for propname in ("bid", "ask", "mark", "strikePrice", "description"):
+        assert np.array_equal(puts.column(propname), before["put"].column(propname))
+    for propname in before["call"].get_propnames():
+        assert np.array_equal(after["call"].column(propname), before["call"].column(propname))